@@ -144,6 +144,23 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 # Define the URL prefix for media files
 MEDIA_URL = '/media/'
 
+# Attachments are sent by core:downloadfile. Set to 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd)
+# to let the front proxy send the file; with nginx, FILE_DOWNLOAD_ACCEL_PREFIX must be an internal location aliased to MEDIA_ROOT
+FILE_DOWNLOAD_MODE = None
+FILE_DOWNLOAD_ACCEL_PREFIX = '/protected-media/'
+
+# Upload limits in bytes, enforced while the request body is read; None disables a limit
+FILE_UPLOAD_MAX_SIZE = 100 * 1024 * 1024
+PROJECT_STORAGE_QUOTA = 1024 * 1024 * 1024
+
+# Permissions are only cached in a backend every worker shares, such as Redis or Memcached;
+# with this per-process default they are read from the database on every request
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,44 @@
+import logging
+import queue
+import threading
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# Work that should not hold up a response runs one job at a time on a single daemon thread.
+# Jobs must be safe to rerun: anything left unfinished when the process exits is picked up again by a management command.
+_jobs = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def submit(func, *args, **kwargs):
+    _ensure_worker()
+    _jobs.put((func, args, kwargs))
+
+
+def _ensure_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name='core-background', daemon=True)
+            _worker.start()
+
+
+def _run():
+    while True:
+        func, args, kwargs = _jobs.get()
+        close_old_connections()
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            logger.exception("Background job %s failed", getattr(func, '__name__', func))
+        finally:
+            close_old_connections()
+            _jobs.task_done()
+
+
+def wait():
+    """Blocks until every submitted job has run."""
+    _jobs.join()
@@ -0,0 +1,88 @@
+import logging
+import time
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Project, Task, TaskDeadline, ProjectPermission, File
+from . import search
+
+logger = logging.getLogger(__name__)
+
+PURGE_BATCH_SIZE = 500
+
+
+def purge_project(project_id, batch_size=PURGE_BATCH_SIZE):
+    """
+    Deletes a project marked as deleting, batch by batch.
+
+    Every batch is its own short transaction, so other writers get the database between batches,
+    and a purge that is interrupted can simply be run again.
+    """
+    if not Project.all_objects.filter(pk=project_id, is_deleting=True).exists():
+        return
+
+    files = File.objects.filter(Q(project_id=project_id) | Q(task__project_id=project_id))
+    while _purge_files(files, batch_size):
+        pass
+
+    assignments = Task.users.through.objects.filter(task__project_id=project_id)
+    while _delete_batch(assignments, batch_size):
+        pass
+
+    deadlines = TaskDeadline.objects.filter(project_id=project_id)
+    while _delete_batch(deadlines, batch_size):
+        pass
+
+    tasks = Task.objects.filter(project_id=project_id)
+    while _purge_tasks(tasks, batch_size):
+        pass
+
+    memberships = ProjectPermission.objects.filter(project_id=project_id)
+    while _delete_batch(memberships, batch_size):
+        pass
+
+    # Nothing references the project any more, so this is a single-row delete
+    Project.all_objects.filter(pk=project_id).delete()
+    logger.info("Purged project %s", project_id)
+
+
+def purge_deleted_projects(batch_size=PURGE_BATCH_SIZE):
+    project_ids = list(Project.all_objects.filter(is_deleting=True).values_list('pk', flat=True))
+    for project_id in project_ids:
+        purge_project(project_id, batch_size)
+    return project_ids
+
+
+def _delete_batch(queryset, batch_size):
+    with transaction.atomic():
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if ids:
+            queryset.model.objects.filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def _purge_files(queryset, batch_size):
+    released_at = time.time()
+    with transaction.atomic():
+        rows = list(queryset.values_list('pk', 'file')[:batch_size])
+        if rows:
+            File.objects.filter(pk__in=[pk for pk, name in rows]).delete()
+
+    # Blobs are only released once their rows are gone, and only if no other project's file shares them
+    try:
+        File.release_blobs([name for pk, name in rows], released_at)
+    except OSError:
+        logger.warning("Could not delete every file of project files %s", [pk for pk, name in rows])
+    return len(rows)
+
+
+def _purge_tasks(queryset, batch_size):
+    with transaction.atomic():
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if ids:
+            # Files, assignees and deadlines are already gone, and the per-task post_delete handlers would
+            # unindex and touch the project one task at a time, so the rows are deleted directly
+            Task.objects.filter(pk__in=ids)._raw_delete(Task.objects.db)
+            search.unindex_tasks(ids)
+    return len(ids)
@@ -0,0 +1,252 @@
+import mimetypes
+import os
+import re
+import zipfile
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse, Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag, http_date, content_disposition_header
+
+# How attachments leave the server:
+#   None                 Django streams the file itself, in FILE_DOWNLOAD_CHUNK_SIZE blocks (or wsgi.file_wrapper)
+#   'x-accel-redirect'   nginx serves FILE_DOWNLOAD_ACCEL_PREFIX + the file's name from an internal location
+#   'x-sendfile'         Apache mod_xsendfile or lighttpd serves the file's absolute path
+# With a front proxy, the proxy also answers Range requests; Django only checks permissions and sets the headers.
+FILE_DOWNLOAD_MODES = (None, 'x-accel-redirect', 'x-sendfile')
+FILE_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+_CONTENT_HASH = re.compile(r'^[0-9a-f]{64}$')
+
+
+class _AttachmentResponse(FileResponse):
+    block_size = FILE_DOWNLOAD_CHUNK_SIZE
+
+
+class _RangeFile:
+    """Reads at most length bytes of an open file from start, so FileResponse streams only the requested range."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def file_etag(name, stat):
+    # Content-addressed names are the content's hash, a strong validator for free
+    stem = os.path.splitext(os.path.basename(name))[0]
+    if _CONTENT_HASH.match(stem):
+        return quote_etag(stem)
+    return quote_etag(f"{stat.st_size:x}-{int(stat.st_mtime):x}")
+
+
+def parse_range(header, size):
+    """Returns (start, end) inclusive for a single satisfiable byte range, None to send the whole file, or False if unsatisfiable."""
+    match = _RANGE.match(header.replace(' ', ''))
+    if not match:
+        # Malformed or multipart ranges are answered with the whole file, which RFC 9110 allows
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        # An empty file has no last bytes to send, so a suffix range on it is unsatisfiable too
+        if length == 0 or size == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def file_response(request, file_obj, thumbnail=False):
+    """Builds the response for downloading an attachment or its thumbnail, answering conditional and Range requests."""
+    storage = file_obj.file.storage
+    if thumbnail:
+        name = file_obj.thumbnail
+        filename = f"{os.path.splitext(file_obj.display_name)[0]}-thumbnail.jpg"
+    else:
+        name = file_obj.file.name
+        filename = file_obj.display_name
+    if not name:
+        raise Http404("The file has no thumbnail.")
+    path = storage.path(name)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        raise Http404("The file is missing from storage.")
+
+    etag = file_etag(name, stat)
+    conditional = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if conditional is not None:
+        _set_cache_headers(conditional, etag, stat)
+        return conditional
+
+    mode = getattr(settings, 'FILE_DOWNLOAD_MODE', None)
+    if mode not in FILE_DOWNLOAD_MODES:
+        raise ValueError(f"FILE_DOWNLOAD_MODE must be one of {FILE_DOWNLOAD_MODES}, not {mode!r}.")
+    if mode is not None:
+        response = _proxy_response(name, filename, path, mode)
+    else:
+        response = _streaming_response(request, filename, path, stat, etag)
+    _set_cache_headers(response, etag, stat)
+    return response
+
+
+def _proxy_response(name, filename, path, mode):
+    # An empty body with the right headers; the proxy replaces it with the file
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'FILE_DOWNLOAD_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + name
+    else:
+        response['X-Sendfile'] = path
+    response['Content-Disposition'] = content_disposition_header(False, filename)
+    return response
+
+
+def _streaming_response(request, filename, path, stat, etag):
+    size = stat.st_size
+    byte_range = None
+    if 'HTTP_RANGE' in request.META and _if_range_matches(request, etag, stat):
+        byte_range = parse_range(request.META['HTTP_RANGE'], size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        # A real file object lets the WSGI server use sendfile through wsgi.file_wrapper
+        response = _AttachmentResponse(file, filename=filename)
+    else:
+        start, end = byte_range
+        response = _AttachmentResponse(_RangeFile(file, start, end - start + 1), filename=filename)
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _if_range_matches(request, etag, stat):
+    # A stale If-Range means the client's partial copy is outdated, so it gets the whole file
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return if_range == http_date(int(stat.st_mtime))
+
+
+def _set_cache_headers(response, etag, stat):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(int(stat.st_mtime))
+    # Access can be revoked, so browsers revalidate every time; an unchanged file costs a 304
+    patch_cache_control(response, private=True, no_cache=True)
+
+
+class _ZipSink:
+    """
+    A write-only, unseekable target for ZipFile. ZipFile then writes each entry's sizes and CRC
+    after its data, so entries can be streamed without knowing them up front.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries):
+    """
+    Yields a ZIP archive of entries, an iterable of (archive name, path on disk) pairs.
+
+    Files are read and compressed one block at a time and every block is yielded as soon as it is
+    written, so memory use does not depend on the size or number of files.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        for arcname, path in entries:
+            try:
+                source = open(path, 'rb')
+            except FileNotFoundError:
+                continue
+            with source:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                with archive.open(info, 'w', force_zip64=True) as target:
+                    for block in iter(lambda: source.read(FILE_DOWNLOAD_CHUNK_SIZE), b''):
+                        target.write(block)
+                        yield from _drain(sink)
+            yield from _drain(sink)
+    # The central directory is written when the archive closes
+    yield from _drain(sink)
+
+
+def _drain(sink):
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def zip_entries(files, storage, folder_by_task=False):
+    """Turns (file name, original name, task id, task name) rows into unique archive names and paths."""
+    used = set()
+    for name, original_name, task_id, task_name in files:
+        arcname = _safe_name(original_name or os.path.basename(name))
+        if folder_by_task and task_id is not None:
+            arcname = f"{_safe_name(task_name)} ({task_id})/{arcname}"
+        arcname = _unique_name(arcname, used)
+        yield arcname, storage.path(name)
+
+
+def _safe_name(name):
+    # Names come from users, so they must not create folders or climb out of one when extracted
+    return name.replace('/', '_').replace('\\', '_').lstrip('.') or '_'
+
+
+def _unique_name(arcname, used):
+    candidate = arcname
+    stem, extension = os.path.splitext(arcname)
+    counter = 1
+    while candidate in used:
+        counter += 1
+        candidate = f"{stem} ({counter}){extension}"
+    used.add(candidate)
+    return candidate
+
+
+def zip_response(entries, filename):
+    response = StreamingHttpResponse(stream_zip(entries), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    patch_cache_control(response, private=True, no_store=True)
+    return response
@@ -2,10 +2,14 @@ from django import forms
 from bootstrap_datepicker_plus.widgets import DateTimePickerInput
 from phonenumber_field.formfields import PhoneNumberField
 from .models import Project, Task, ProjectPermission, UserProfile, File
+from .permissions import get_permission_resolver
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.db.models import Q, F
 from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.utils import timezone
+from django.utils.http import urlencode
+from datetime import timedelta
 
 # Allow bulk file upload
 class MultipleFileInput(forms.ClearableFileInput):
@@ -32,30 +36,15 @@ class BulkModifyPermissionForm(forms.Form):
         request = kwargs.pop('request')
         super().__init__(*args, **kwargs)
 
-        current_user_permission = ProjectPermission.objects.filter(
-            project=project,
-            user=request.user
-        ).first().permission
+        # Both bulk forms share the request's resolver, so eligible members are computed once per request
+        resolver = get_permission_resolver(request, project.id)
+        current_user_level = resolver.level
 
-        users = project.users.exclude(
-            id=request.user.id
-        ).exclude(
-            id=project.creator.id
-        )
-
-        filtered_users = []
-        for user in users:
-            user_permission = ProjectPermission.PERMISSION_LEVELS.get(
-                project.permissions.filter(user=user).first().permission
-            )
-            if user_permission is not None and user_permission < ProjectPermission.PERMISSION_LEVELS.get(current_user_permission):
-                filtered_users.append((user.id, user.username))
-
-        self.fields['selected_users'].choices = filtered_users
+        self.fields['selected_users'].choices = resolver.manageable_members(project)
 
         permission_choices = [
             (key, value) for key, value in ProjectPermission.PERMISSION_CHOICES
-            if key != 'creator' and ProjectPermission.PERMISSION_LEVELS.get(key) <= ProjectPermission.PERMISSION_LEVELS.get(current_user_permission)
+            if key != 'creator' and ProjectPermission.PERMISSION_LEVELS.get(key) <= current_user_level
         ]
         self.fields['new_permission'].choices = permission_choices
 
@@ -67,26 +56,81 @@ class BulkRemoveUserForm(forms.Form):
         request = kwargs.pop('request')
         super().__init__(*args, **kwargs)
 
-        current_user_permission = ProjectPermission.objects.filter(
-            project=project,
-            user=request.user
-        ).first().permission
+        resolver = get_permission_resolver(request, project.id)
+        self.fields['selected_users'].choices = resolver.manageable_members(project)
 
-        users = project.users.exclude(
-            id=request.user.id
-        ).exclude(
-            id=project.creator.id
-        )
+class TaskFilterForm(forms.Form):
+    status = forms.ChoiceField(
+        choices=[('', 'Any status')] + list(Task.STATUS_CHOICES),
+        required=False,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    assignee = forms.ModelChoiceField(
+        queryset=User.objects.none(),
+        required=False,
+        empty_label='Anyone',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    start = forms.DateTimeField(
+        required=False,
+        widget=forms.DateTimeInput(attrs={'type': 'datetime-local', 'class': 'form-control'})
+    )
+    end = forms.DateTimeField(
+        required=False,
+        widget=forms.DateTimeInput(attrs={'type': 'datetime-local', 'class': 'form-control'})
+    )
+
+    def __init__(self, *args, **kwargs):
+        project = kwargs.pop('project')
+        super().__init__(*args, **kwargs)
+        self.fields['assignee'].queryset = project.users.all()
+
+    def filter_query(self):
+        """Returns the validated filters as a query string, without parameters the form does not know."""
+        params = {}
+        for name, value in self.cleaned_data.items():
+            if value in (None, ''):
+                continue
+            if isinstance(value, User):
+                value = value.pk
+            elif hasattr(value, 'isoformat'):
+                value = timezone.localtime(value).replace(tzinfo=None).isoformat()
+            params[name] = value
+        return urlencode(params)
+
+    def filter_tasks(self, tasks):
+        # Every condition is a range on a (project, column) index prefix or the Task.users through table
+        status = self.cleaned_data.get('status')
+        assignee = self.cleaned_data.get('assignee')
+        start = self.cleaned_data.get('start')
+        end = self.cleaned_data.get('end')
+
+        if status:
+            tasks = tasks.filter(status=status)
+        if assignee:
+            tasks = tasks.filter(users=assignee)
+        # Keep tasks whose [start_datetime, end_datetime] overlaps the requested window
+        if start:
+            tasks = tasks.filter(end_datetime__gte=start)
+        if end:
+            tasks = tasks.filter(start_datetime__lte=end)
+        return tasks
+
+class RotateInviteCodeForm(forms.Form):
+    EXPIRY_CHOICES = (
+        ('', 'Never'),
+        ('1', '1 day'),
+        ('7', '7 days'),
+        ('30', '30 days'),
+    )
 
-        filtered_users = []
-        for user in users:
-            user_permission = ProjectPermission.PERMISSION_LEVELS.get(
-                project.permissions.filter(user=user).first().permission
-            )
-            if user_permission is not None and user_permission < ProjectPermission.PERMISSION_LEVELS.get(current_user_permission):
-                filtered_users.append((user.id, user.username))
+    expires_in = forms.ChoiceField(choices=EXPIRY_CHOICES, required=False, label='Expires after')
 
-        self.fields['selected_users'].choices = filtered_users
+    def expires_at(self):
+        days = self.cleaned_data.get('expires_in')
+        if not days:
+            return None
+        return timezone.now() + timedelta(days=int(days))
 
 class AddProjectForm(forms.ModelForm):
     class Meta:
@@ -114,17 +158,13 @@ class AddTaskForm(forms.ModelForm):
 
         if start_datetime and end_datetime and start_datetime > end_datetime:
             raise ValidationError("Start datetime must be same as or before the end datetime.")
-        
+
     def save(self, commit=True):
         instance = super().save(commit=commit)
 
         if commit:
-            # Save the new_files only when commit is True
-            new_files = self.cleaned_data.get('new_files')
-            if new_files:
-                for uploaded_file in new_files:
-                    file_instance = File(file=uploaded_file, project=instance.project, task=instance)
-                    file_instance.save()
+            # Files go through Task.add_files, which enforces the project's storage quota
+            instance.add_files(self.cleaned_data.get('new_files') or [])
 
         return instance
 
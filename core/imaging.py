@@ -0,0 +1,60 @@
+"""
+Thumbnail rendering. Runs in worker processes, so this module must not import Django.
+"""
+import os
+import tempfile
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional, attachments then simply have no thumbnails
+    Image = None
+
+THUMBNAIL_SIZE = (320, 320)
+THUMBNAIL_QUALITY = 80
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff'}
+
+
+def is_available():
+    return Image is not None
+
+
+def is_image_name(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def render_thumbnail(source_path, target_path):
+    """
+    Writes a JPEG no larger than THUMBNAIL_SIZE of the first frame or page of an image.
+
+    The thumbnail is written to a temporary file and renamed into place, so readers never see half of it.
+    Returns False if the source is not an image Pillow can read.
+    """
+    try:
+        with Image.open(source_path) as image:
+            # draft() lets JPEG decode at a reduced scale, so large photos are never fully decoded
+            image.draft('RGB', THUMBNAIL_SIZE)
+            image.seek(0)
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail(THUMBNAIL_SIZE)
+            if image.mode in ('RGBA', 'LA', 'P'):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode != 'RGB':
+                image = image.convert('RGB')
+
+            directory = os.path.dirname(target_path)
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.thumbnail-')
+            try:
+                with os.fdopen(fd, 'wb') as temp_file:
+                    image.save(temp_file, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+                os.replace(temp_path, target_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return False
+    return True
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import File
+from core import imaging, thumbnails
+
+
+class Command(BaseCommand):
+    help = "Builds the missing thumbnails of image attachments, e.g. ones skipped while the thumbnail queue was full."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not imaging.is_available():
+            raise CommandError("Building thumbnails requires Pillow.")
+
+        storage = File._meta.get_field('file').storage
+        built = failed = 0
+        last_name = ''
+        # Walks distinct blob names in order, so each shared blob is rendered once
+        while True:
+            names = list(
+                File.objects.filter(thumbnail='', file__gt=last_name).order_by('file').values_list('file', flat=True).distinct()[:options['batch_size']]
+            )
+            if not names:
+                break
+            last_name = names[-1]
+            for name in names:
+                if not thumbnails.wants_thumbnail(name) or not storage.exists(name):
+                    continue
+                if thumbnails.build(storage, name):
+                    built += 1
+                else:
+                    failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Built {built} thumbnails, {failed} files could not be read as images."))
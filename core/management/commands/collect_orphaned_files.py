@@ -0,0 +1,74 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from core.models import File
+
+GC_BATCH_SIZE = 1000
+GC_MIN_AGE = 3600
+
+
+class Command(BaseCommand):
+    help = "Removes files under the media directory that no File row points to; --dry-run only lists them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="List orphaned files without removing them.")
+        parser.add_argument('--min-age', type=int, default=GC_MIN_AGE,
+                            help="Ignore files modified less than this many seconds ago, which may belong to an upload in flight.")
+        parser.add_argument('--batch-size', type=int, default=GC_BATCH_SIZE)
+        parser.add_argument('--prefix', default='files', help="Directory below MEDIA_ROOT to scan.")
+
+    def handle(self, *args, **options):
+        storage = File._meta.get_field('file').storage
+        root = storage.path(options['prefix'])
+        if not os.path.isdir(root):
+            raise CommandError(f"{root} is not a directory.")
+
+        delete = not options['dry_run']
+        cutoff = time.time() - options['min_age']
+        orphans = 0
+        reclaimed = 0
+
+        for batch in _batched(_old_files(storage.path(''), root, cutoff), options['batch_size']):
+            # One indexed lookup per batch, so neither the directory nor the table is ever held in memory
+            names = [name for name, entry in batch]
+            referenced = set(File.objects.filter(file__in=names).values_list('file', flat=True))
+            referenced.update(File.objects.filter(thumbnail__in=names).values_list('thumbnail', flat=True))
+            for name, entry in batch:
+                if name in referenced:
+                    continue
+                size = entry.stat().st_size
+                if delete:
+                    # Checked again right before removal, in case an upload reused the name meanwhile
+                    if File.objects.filter(Q(file=name) | Q(thumbnail=name)).exists():
+                        continue
+                    os.remove(entry.path)
+                orphans += 1
+                reclaimed += size
+                self.stdout.write(f"{'Removed' if delete else 'Orphaned'}: {name} ({size} bytes)")
+
+        action = "Removed" if delete else "Found"
+        self.stdout.write(self.style.SUCCESS(f"{action} {orphans} orphaned files, {reclaimed} bytes."))
+
+
+def _old_files(media_root, directory, cutoff):
+    # Streams (name relative to MEDIA_ROOT, DirEntry) pairs; os.scandir reads directories lazily
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _old_files(media_root, entry.path, cutoff)
+            elif entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                yield os.path.relpath(entry.path, media_root).replace(os.sep, '/'), entry
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
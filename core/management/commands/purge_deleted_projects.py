@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.deletion import purge_deleted_projects, PURGE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Finishes deleting projects marked as deleting, e.g. after the process was restarted mid-purge."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        project_ids = purge_deleted_projects(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Purged {len(project_ids)} projects."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core.models import TaskDeadline
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the per-user task deadline table from task assignments and project memberships."
+
+    def handle(self, *args, **options):
+        count = TaskDeadline.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Recorded {count} task deadlines."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text task search index from the Task table."
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError("Task search requires the sqlite3 database backend.")
+
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} tasks."))
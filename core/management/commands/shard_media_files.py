@@ -0,0 +1,101 @@
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import Project, Task, File, task_file_upload_to
+from core.storage import content_hash
+
+SHARD_BATCH_SIZE = 500
+
+_BLOB_NAME = re.compile(r'^[0-9a-f]{2}/[0-9a-f]{64}(\.[^/]*)?$')
+
+
+class Command(BaseCommand):
+    help = "Moves task attachments into the sharded, content-addressed layout and rewrites File.file to match."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SHARD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        storage = File._meta.get_field('file').storage
+        moved = missing = 0
+        last_pk = 0
+
+        # Walks the table in primary key order, one batch per transaction. Rows already in the new layout are
+        # skipped, so an interrupted run is resumed by simply running the command again
+        while True:
+            batch = list(File.objects.filter(pk__gt=last_pk).order_by('pk').only('id', 'project_id', 'task_id', 'file')[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+
+            # Older attachments may only know their task; their directory is that task's project, whose
+        # bytes_used already counts them, so setting the project below needs no size change
+            task_projects = dict(Task.objects.filter(
+                pk__in=[file_obj.task_id for file_obj in batch if file_obj.project_id is None and file_obj.task_id]
+            ).values_list('pk', 'project_id'))
+            for file_obj in batch:
+                if file_obj.project_id is None:
+                    file_obj.project_id = task_projects.get(file_obj.task_id)
+
+            changed = []
+            old_names = []
+            for file_obj in batch:
+                old_name = file_obj.file.name
+                if not old_name or _is_sharded(file_obj):
+                    continue
+                if not storage.exists(old_name):
+                    missing += 1
+                    self.stderr.write(f"Missing on disk: {old_name} (File {file_obj.pk})")
+                    continue
+
+                with storage.open(old_name, 'rb') as content:
+                    digest = content_hash(content)
+                new_name = storage.blob_name(task_file_upload_to(file_obj, os.path.basename(old_name)), digest)
+                _copy_into_place(storage.path(old_name), storage.path(new_name))
+
+                file_obj.file.name = new_name
+                changed.append(file_obj)
+                old_names.append(old_name)
+
+            if not changed:
+                continue
+
+            released_at = time.time()
+            with transaction.atomic():
+                File.objects.bulk_update(changed, ['file', 'project'])
+                for project_id in {file_obj.project_id for file_obj in changed} - {None}:
+                    Project.mark_changed(project_id)
+            # A crash before this point leaves only orphans behind, which collect_orphaned_files removes
+            File.release_blobs(old_names, released_at)
+            moved += len(changed)
+
+        self.stdout.write(self.style.SUCCESS(f"Moved {moved} files, {missing} missing on disk."))
+
+
+def _is_sharded(file_obj):
+    prefix = task_file_upload_to(file_obj, '')
+    name = file_obj.file.name
+    return name.startswith(prefix) and bool(_BLOB_NAME.match(name[len(prefix):]))
+
+
+def _copy_into_place(source, target):
+    if os.path.exists(target):
+        return
+    directory = os.path.dirname(target)
+    os.makedirs(directory, exist_ok=True)
+    try:
+        # A hard link costs no copy and leaves the source intact until its row has been rewritten
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError:
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        os.close(fd)
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, target)
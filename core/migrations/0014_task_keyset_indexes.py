@@ -0,0 +1,25 @@
+# Generated by Django 4.2.1 on 2026-10-18 16:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_alter_userprofile_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['project', 'start_datetime', 'id'], name='core_task_project_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['project', 'end_datetime', 'id'], name='core_task_project_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['project', 'status', 'id'], name='core_task_project_status_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations
+
+from core import search
+
+
+def create_task_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    search.create_index(schema_editor)
+    schema_editor.execute(
+        f"INSERT INTO {search.FTS_TABLE} (rowid, name, description, project_id) "
+        "SELECT id, name, description, project_id FROM core_task"
+    )
+
+
+def drop_task_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    search.drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_task_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_task_search_index, drop_task_search_index),
+    ]
@@ -0,0 +1,75 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import phonenumber_field.modelfields
+
+
+PROFILE_FIELDS = ['display_name', 'role', 'phone_number', 'email_address']
+
+
+def copy_profiles_to_memberships(apps, schema_editor):
+    ProjectPermission = apps.get_model('core', 'ProjectPermission')
+    UserProfile = apps.get_model('core', 'UserProfile')
+
+    # One UPDATE over every membership; profiles without a membership row are dropped
+    profiles = UserProfile.objects.filter(project_id=OuterRef('project_id'), user_id=OuterRef('user_id')).order_by('-id')
+    ProjectPermission.objects.update(**{
+        field: Subquery(profiles.values(field)[:1]) for field in PROFILE_FIELDS
+    })
+
+
+def copy_memberships_to_profiles(apps, schema_editor):
+    ProjectPermission = apps.get_model('core', 'ProjectPermission')
+    UserProfile = apps.get_model('core', 'UserProfile')
+
+    UserProfile.objects.bulk_create(
+        (
+            UserProfile(project_id=membership.project_id, user_id=membership.user_id,
+                        **{field: getattr(membership, field) for field in PROFILE_FIELDS})
+            for membership in ProjectPermission.objects.iterator()
+        ),
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_project_change_marker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='projectpermission',
+            name='display_name',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectpermission',
+            name='role',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='projectpermission',
+            name='phone_number',
+            field=phonenumber_field.modelfields.PhoneNumberField(blank=True, max_length=20, null=True, region=None),
+        ),
+        migrations.AddField(
+            model_name='projectpermission',
+            name='email_address',
+            field=models.EmailField(blank=True, max_length=254, null=True),
+        ),
+        migrations.RunPython(copy_profiles_to_memberships, copy_memberships_to_profiles),
+        migrations.DeleteModel(
+            name='UserProfile',
+        ),
+        migrations.CreateModel(
+            name='UserProfile',
+            fields=[],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=('core.projectpermission',),
+        ),
+    ]
@@ -0,0 +1,46 @@
+from django.db import migrations, models
+from django.db.models import Count
+import secrets
+import string
+
+
+INVITE_CODE_ALPHABET = string.ascii_lowercase + string.digits
+
+
+def reissue_duplicate_invite_codes(apps, schema_editor):
+    Project = apps.get_model('core', 'Project')
+
+    # An empty string would otherwise count as a code shared by every such project
+    Project.objects.filter(invite_code='').update(invite_code=None)
+
+    # The oldest project keeps a shared code, every later one gets a fresh code before the unique index is built
+    duplicated = Project.objects.exclude(invite_code=None).values('invite_code').annotate(n=Count('id')).filter(n__gt=1)
+    taken = set(Project.objects.exclude(invite_code=None).values_list('invite_code', flat=True))
+    for row in duplicated:
+        for project in Project.objects.filter(invite_code=row['invite_code']).order_by('id')[1:]:
+            invite_code = None
+            while invite_code is None or invite_code in taken:
+                invite_code = ''.join(secrets.choice(INVITE_CODE_ALPHABET) for _ in range(7))
+            taken.add(invite_code)
+            Project.objects.filter(pk=project.pk).update(invite_code=invite_code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_merge_userprofile_into_projectpermission'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='invite_code_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(reissue_duplicate_invite_codes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='project',
+            name='invite_code',
+            field=models.CharField(blank=True, max_length=7, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 16:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_invite_code_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='is_deleting',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.1 on 2026-10-18 16:59
+
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_file_name_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='original_name',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='file',
+            name='file',
+            field=models.FileField(db_index=True, max_length=255, storage=core.storage.ContentAddressedStorage(), upload_to='files/'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.1 on 2026-10-18 17:01
+
+import core.models
+import core.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_content_addressed_files'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='file',
+            name='file',
+            field=models.FileField(db_index=True, max_length=255, storage=core.storage.ContentAddressedStorage(), upload_to=core.models.task_file_upload_to),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_sharded_file_paths'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='thumbnail',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.1 on 2026-10-18 17:16
+
+from django.db import migrations, models
+from django.db.models import F, Func, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+import os
+
+
+def backfill_storage_usage(apps, schema_editor):
+    File = apps.get_model('core', 'File')
+    Project = apps.get_model('core', 'Project')
+    storage = File._meta.get_field('file').storage
+
+    # Sizes come from disk once, in batches; files missing on disk count as empty
+    batch = []
+    for file_obj in File.objects.only('id', 'file').iterator(chunk_size=500):
+        try:
+            file_obj.size = os.path.getsize(storage.path(file_obj.file.name)) if file_obj.file.name else 0
+        except OSError:
+            file_obj.size = 0
+        batch.append(file_obj)
+        if len(batch) == 500:
+            File.objects.bulk_update(batch, ['size'])
+            batch = []
+    File.objects.bulk_update(batch, ['size'])
+
+    # Older attachments may only know their task, they count towards that task's project
+    usage = File.objects.filter(
+        Q(project=OuterRef('pk')) | Q(project__isnull=True, task__project=OuterRef('pk'))
+    ).order_by().annotate(total=Func(F('size'), function='SUM')).values('total')
+    Project.objects.update(bytes_used=Coalesce(Subquery(usage), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_file_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='file',
+            name='size',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='bytes_used',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_storage_usage, migrations.RunPython.noop),
+    ]
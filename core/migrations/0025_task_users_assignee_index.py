@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_storage_usage'),
+    ]
+
+    # Task.users is an auto-created through table, so its index cannot be declared in Meta.indexes.
+    # (user_id, task_id) answers "tasks assigned to this user" from the index alone.
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX "core_task_users_user_task_idx" ON "core_task_users" ("user_id", "task_id")',
+            'DROP INDEX "core_task_users_user_task_idx"',
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.1 on 2026-10-18 17:28
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+import django.db.models.deletion
+
+
+def populate_task_deadlines(apps, schema_editor):
+    Task = apps.get_model('core', 'Task')
+    TaskDeadline = apps.get_model('core', 'TaskDeadline')
+    ProjectPermission = apps.get_model('core', 'ProjectPermission')
+
+    # Same rows as TaskDeadline.add_assignments, which historical models do not have
+    memberships = ProjectPermission.objects.filter(project_id=OuterRef('task__project_id'), user_id=OuterRef('user_id'))
+    assignments = Task.users.through.objects.filter(Exists(memberships)).values_list(
+        'user_id', 'task_id', 'task__project_id', 'task__end_datetime', 'task__status'
+    )
+    batch = []
+    for user_id, task_id, project_id, end_datetime, status in assignments.iterator(chunk_size=1000):
+        batch.append(TaskDeadline(user_id=user_id, task_id=task_id, project_id=project_id, end_datetime=end_datetime, status=status))
+        if len(batch) == 1000:
+            TaskDeadline.objects.bulk_create(batch)
+            batch = []
+    TaskDeadline.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('core', '0025_task_users_assignee_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskDeadline',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('end_datetime', models.DateTimeField()),
+                ('status', models.CharField(choices=[('Not yet started', 'Not yet started'), ('In-process', 'In-process'), ('Completed', 'Completed')], max_length=20)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.project')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deadlines', to='core.task')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='task_deadlines', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'end_datetime', 'id'], name='core_taskdeadline_user_end_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='taskdeadline',
+            constraint=models.UniqueConstraint(fields=('user', 'task'), name='core_taskdeadline_user_task_uniq'),
+        ),
+        migrations.RunPython(populate_task_deadlines, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+from django.db.models import F, Func, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def recount_storage_usage(apps, schema_editor):
+    File = apps.get_model('core', 'File')
+    Project = apps.get_model('core', 'Project')
+
+    # 0024 first left out attachments that only knew their task, which shard_media_files later gave a project
+    # without counting them; the counters are summed again over both kinds of rows
+    usage = File.objects.filter(
+        Q(project=OuterRef('pk')) | Q(project__isnull=True, task__project=OuterRef('pk'))
+    ).order_by().annotate(total=Func(F('size'), function='SUM')).values('total')
+    Project.objects.update(bytes_used=Coalesce(Subquery(usage), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0026_task_deadlines'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_storage_usage, migrations.RunPython.noop),
+    ]
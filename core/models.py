@@ -1,53 +1,164 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, transaction, IntegrityError
+from django.db.models import Exists, OuterRef
 from django.contrib.auth.models import User
-import uuid
+from django.utils import timezone
+import itertools
+import secrets
+import string
+import time
 from phonenumber_field.modelfields import PhoneNumberField
 import os
 
+from . import permission_cache
+from .storage import task_file_storage
+from .thumbnails import thumbnail_name
+from .uploads import QuotaExceeded
+
+INVITE_CODE_LENGTH = 7
+INVITE_CODE_ALPHABET = string.ascii_lowercase + string.digits
+INVITE_CODE_ATTEMPTS = 10
+
+def generate_invite_code():
+    return ''.join(secrets.choice(INVITE_CODE_ALPHABET) for _ in range(INVITE_CODE_LENGTH))
+
+class ActiveProjectManager(models.Manager):
+    # Projects being purged in the background are invisible everywhere but in all_objects
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleting=False)
+
 class Project(models.Model):
     name = models.CharField(max_length=100)
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name="created_projects", editable=False, null=True)
 
-    invite_code = models.CharField(max_length=7, blank=True, null=True)
+    # Unique, so joining is an index lookup and two projects can never share a code
+    invite_code = models.CharField(max_length=INVITE_CODE_LENGTH, blank=True, null=True, unique=True)
+    invite_code_expires_at = models.DateTimeField(blank=True, null=True)
     users = models.ManyToManyField(User, through='ProjectPermission', related_name="joined_projects")
 
+    # Change marker for conditional GETs, touched by task, file, membership and profile writes
+    version = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    # Sum of File.size over the project's files, kept up to date by every file write
+    bytes_used = models.BigIntegerField(default=0, editable=False)
+
+    # Set by delete_project, the rows are then reclaimed in batches by core.deletion
+    is_deleting = models.BooleanField(default=False, editable=False)
+
+    objects = ActiveProjectManager()
+    all_objects = models.Manager()
+
+    # Written by mark_changed, delete_project and rotate_invite_code only, never by save() of an existing row
+    UPDATED_IN_PLACE = ('version', 'updated_at', 'bytes_used', 'is_deleting', 'invite_code', 'invite_code_expires_at')
+
+    @staticmethod
+    def mark_changed(project_id, bytes_delta=0):
+        # File writes pass their size change, so the usage counter moves in the same UPDATE
+        changes = {'version': models.F('version') + 1, 'updated_at': timezone.now()}
+        if bytes_delta:
+            changes['bytes_used'] = models.F('bytes_used') + bytes_delta
+        Project.objects.filter(pk=project_id).update(**changes)
+
+    def remaining_bytes(self):
+        quota = settings.PROJECT_STORAGE_QUOTA
+        if quota is None:
+            return None
+        return quota - self.bytes_used
+
+    @classmethod
+    def by_invite_code(cls, invite_code):
+        # Expired codes match nothing, so they join no one
+        return cls.objects.filter(
+            models.Q(invite_code_expires_at__isnull=True) | models.Q(invite_code_expires_at__gt=timezone.now()),
+            invite_code=invite_code,
+        )
+
+    def rotate_invite_code(self, expires_at=None):
+        """Replaces the invite code with a fresh one, so links handed out before stop working."""
+        for attempt in range(INVITE_CODE_ATTEMPTS):
+            invite_code = generate_invite_code()
+            try:
+                # The savepoint keeps a collision from breaking an enclosing transaction
+                with transaction.atomic():
+                    Project.objects.filter(pk=self.pk).update(invite_code=invite_code, invite_code_expires_at=expires_at)
+            except IntegrityError:
+                if attempt == INVITE_CODE_ATTEMPTS - 1:
+                    raise
+                continue
+            self.invite_code = invite_code
+            self.invite_code_expires_at = expires_at
+            Project.mark_changed(self.pk)
+            return invite_code
+
+    def _membership_changed(self):
+        permission_cache.bump_version(self.id)
+        Project.mark_changed(self.id)
+
+    def member_directory(self):
+        """Returns the members as User rows annotated with their membership and profile, in one query."""
+        return User.objects.annotate(
+            membership=models.FilteredRelation('project_permissions', condition=models.Q(project_permissions__project=self)),
+        ).filter(
+            membership__isnull=False
+        ).annotate(
+            # Same value as the user's id, but ordering by it follows the (project, user) index
+            member_id=models.F('membership__user_id'),
+            permission=models.F('membership__permission'),
+            permission_label=ProjectPermission.label_expression('membership__permission'),
+            permission_level=ProjectPermission.level_expression('membership__permission'),
+            nickname=models.F('membership__nickname'),
+            display_name=models.F('membership__display_name'),
+            role=models.F('membership__role'),
+            phone_number=models.F('membership__phone_number'),
+            email_address=models.F('membership__email_address'),
+        ).only('id', 'username')
+
     def delete_project(self):
-        self.delete()
+        from .deletion import purge_project
+        from . import background
+
+        # Hiding the project is one UPDATE; tasks, files and memberships are purged off the request
+        Project.all_objects.filter(pk=self.pk).update(is_deleting=True)
+        self.is_deleting = True
+        permission_cache.bump_version(self.pk)
+        transaction.on_commit(lambda: background.submit(purge_project, self.pk))
 
     def addUser(self, user):
-        if not self.users.filter(id=user.id).exists():
-            self.users.add(user)
-            project_permission, created = ProjectPermission.objects.get_or_create(
-                project=self,
-                user=user,
-                defaults={'permission': 'read'}  # Grant 'read' permission if it's a new ProjectPermission
-            )
-            # For some reason, code does not work if the below code is not included, although the below code is never executed
-            if not created:
-                project_permission.permission = 'read'
-                project_permission.save()
-                
-            # Create a user profile for the user in this project
-            UserProfile.objects.create(user=user, project=self)
+        self.add_users([user])
+
+    def add_users(self, users):
+        # Existing members are skipped by INSERT OR IGNORE on the (project, user) unique index,
+        # so joining needs no existence check and keeps the member's current permission
+        memberships = [ProjectPermission(project=self, user=user, permission='read') for user in users]
+        with transaction.atomic():
+            ProjectPermission.objects.bulk_create(memberships, ignore_conflicts=True)
+            # A returning member gets back the agenda rows of the assignments they kept
+            TaskDeadline.add_assignments(task__project=self, user_id__in=[user.id for user in users])
+            self._membership_changed()
 
     def removeUser(self, user):
-        self.users.remove(user)
-        ProjectPermission.objects.filter(project=self, user=user).delete()
-        # Delete the associated UserProfile for the user in this project
-        UserProfile.objects.filter(user=user, project=self).delete()
+        self.remove_users([user.id])
 
     def updatePermission(self, user, new_permission):
-        project_permission = ProjectPermission.objects.filter(project=self, user=user).first()
-        if project_permission:
-            project_permission.permission = new_permission
-            project_permission.save()
+        self.update_permissions([user.id], new_permission)
+
+    def remove_users(self, user_ids):
+        # ProjectPermission is the through table of Project.users and holds the profile, so one DELETE removes everything
+        with transaction.atomic():
+            ProjectPermission.objects.filter(project=self, user_id__in=user_ids).delete()
+            TaskDeadline.objects.filter(project=self, user_id__in=user_ids).delete()
+            self._membership_changed()
+
+    def update_permissions(self, user_ids, new_permission):
+        with transaction.atomic():
+            ProjectPermission.objects.filter(project=self, user_id__in=user_ids).update(permission=new_permission)
+            self._membership_changed()
     
     def save(self, *args, **kwargs):
         is_new_project = self.pk is None  # Check if it's a new project being created
         if is_new_project:
-            if not self.invite_code:
-                self.invite_code = str(uuid.uuid4())[:7]
-            super().save(*args, **kwargs)  # Save the project instance first
+            self._insert_with_invite_code(*args, **kwargs)  # Save the project instance first
 
             # Create ProjectPermission for the creator with 'creator' permission
             ProjectPermission.objects.create(
@@ -55,13 +166,43 @@ class Project(models.Model):
                 user=self.creator,
                 permission='creator'
             )
-            UserProfile.objects.create(user=self.creator, project=self)
+            # Project ids can be reused, so drop anything cached under a previous project
+            permission_cache.bump_version(self.id)
         else:
+            if not args and kwargs.get('update_fields') is None:
+                # These columns only change through single-column UPDATEs, which a save from an older copy must not undo
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in self.UPDATED_IN_PLACE
+                ]
             super().save(*args, **kwargs)
+            # Project pages show the name, so their ETags must change with it
+            Project.mark_changed(self.pk)
+
+    def _insert_with_invite_code(self, *args, **kwargs):
+        # A generated code that collides with another project's is simply redrawn;
+        # a code set by the caller is kept and a collision is reported
+        generated = not self.invite_code
+        for attempt in range(INVITE_CODE_ATTEMPTS):
+            if generated:
+                self.invite_code = generate_invite_code()
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                self.pk = None
+                if not generated or attempt == INVITE_CODE_ATTEMPTS - 1:
+                    raise
 
     def __str__(self):
         return f"{self.name}"
     
+class ProjectPermissionQuerySet(models.QuerySet):
+    def with_level(self):
+        # Annotates the numeric PERMISSION_LEVELS value so levels can be compared in SQL
+        return self.annotate(level=ProjectPermission.level_expression())
+
 class ProjectPermission(models.Model):
     PERMISSION_CHOICES = (
         ('read', 'Read'),
@@ -93,9 +234,42 @@ class ProjectPermission(models.Model):
 
     nickname = models.CharField(max_length=100, blank=True, null=True)
 
+    # Per-project profile, edited through the UserProfile proxy
+    display_name = models.CharField(max_length=100, blank=True, null=True)
+    role = models.CharField(max_length=100, blank=True, null=True)
+    phone_number = PhoneNumberField(max_length=20, blank=True, null=True)
+    email_address = models.EmailField(blank=True, null=True)
+
+    objects = ProjectPermissionQuerySet.as_manager()
+
     class Meta:
         unique_together = ('project', 'user')
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Project.mark_changed(self.project_id)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        Project.mark_changed(self.project_id)
+        return result
+
+    @classmethod
+    def level_expression(cls, field='permission'):
+        return models.Case(
+            *[models.When(**{field: permission}, then=models.Value(level)) for permission, level in cls.PERMISSION_LEVELS.items()],
+            default=models.Value(0),
+            output_field=models.IntegerField(),
+        )
+
+    @classmethod
+    def label_expression(cls, field='permission'):
+        return models.Case(
+            *[models.When(**{field: permission}, then=models.Value(label)) for permission, label in cls.PERMISSION_CHOICES],
+            default=models.Value(''),
+            output_field=models.CharField(),
+        )
+
     def has_permission(self, target_permission):
         return self.PERMISSION_LEVELS[self.permission] >= self.PERMISSION_LEVELS[target_permission]
     
@@ -103,17 +277,24 @@ class ProjectPermission(models.Model):
         return self.PERMISSION_LEVELS.get(self.permission, 0)
 
     
-class UserProfile(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="profiles")
-    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="user_profiles")
-    display_name = models.CharField(max_length=100, blank=True, null=True)
-    role = models.CharField(max_length=100, blank=True, null=True)
-    phone_number = PhoneNumberField(max_length=20, blank=True, null=True)
-    email_address = models.EmailField(blank=True, null=True)
+class UserProfile(ProjectPermission):
+    # A user's profile in a project is stored on their ProjectPermission row
+    class Meta:
+        proxy = True
 
     def __str__(self):
         return f"Profile for {self.user.username} in {self.project.name}"
     
+class TaskQuerySet(models.QuerySet):
+    def for_table(self):
+        # Loads only what the task table shows, with assignees and files fetched in one query each
+        return self.only(
+            'id', 'project_id', 'name', 'start_datetime', 'end_datetime', 'status'
+        ).prefetch_related(
+            models.Prefetch('users', queryset=User.objects.only('id', 'username')),
+            models.Prefetch('task_files', queryset=File.objects.only('id', 'task_id', 'file', 'original_name', 'thumbnail')),
+        )
+
 class Task(models.Model):
     STATUS_CHOICES = (
         ('Not yet started', 'Not yet started'),
@@ -131,25 +312,192 @@ class Task(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES)
     users = models.ManyToManyField(User, related_name='tasks')
 
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        # Back the keyset-paginated task list, one index per sortable column
+        indexes = [
+            models.Index(fields=['project', 'start_datetime', 'id'], name='core_task_project_start_idx'),
+            models.Index(fields=['project', 'end_datetime', 'id'], name='core_task_project_end_idx'),
+            models.Index(fields=['project', 'status', 'id'], name='core_task_project_status_idx'),
+        ]
+
     def delete_task(self):
         self.delete()
 
+    def add_files(self, uploaded_files):
+        """Attaches uploaded files to the task, all or none of them, within the project's storage quota."""
+        files = [File(project_id=self.project_id, task=self, file=uploaded_file) for uploaded_file in uploaded_files]
+        if not files:
+            return files
+        # Only saved files have content-addressed names; the others still carry the client's file name
+        saved_names = []
+        try:
+            with transaction.atomic():
+                for file_obj in files:
+                    file_obj.save()
+                    saved_names.append(file_obj.file.name)
+                # The counter was raised by the saves above, which also locks the project row until commit
+                quota = settings.PROJECT_STORAGE_QUOTA
+                if quota is not None and Project.objects.filter(pk=self.project_id, bytes_used__gt=quota).exists():
+                    raise QuotaExceeded("These files do not fit in the project's remaining storage.")
+        except BaseException:
+            File.release_blobs(saved_names, time.time())
+            raise
+        return files
+
     def __str__(self):
         return f"{self.name}"
-    
+
+class TaskDeadlineQuerySet(models.QuerySet):
+    def agenda(self, user):
+        # A range of the (user, end_datetime, id) index; task and project are joined by primary key for their names only
+        return self.filter(user=user, project__is_deleting=False).select_related('task', 'project').only(
+            'id', 'end_datetime', 'status', 'task', 'task__name', 'project', 'project__name'
+        )
+
+class TaskDeadline(models.Model):
+    """
+    A user's assignment to a task, with the task's deadline and status copied next to it.
+
+    There is one row per Task.users assignment whose user is a member of the task's project. The
+    receivers in core.signals and Project.add_users/remove_users keep it in step, and
+    rebuild_task_deadlines repopulates it from scratch.
+    """
+    # Leading column of the agenda index, so it needs no index of its own
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='task_deadlines', db_index=False)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='deadlines')
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='+')
+    end_datetime = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES)
+
+    objects = TaskDeadlineQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'task'], name='core_taskdeadline_user_task_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'end_datetime', 'id'], name='core_taskdeadline_user_end_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task_id} due {self.end_datetime} for user {self.user_id}"
+
+    @classmethod
+    def add_assignments(cls, batch_size=1000, **filters):
+        """
+        Inserts the rows of the Task.users assignments matching filters, skipping users who are not
+        members of the task's project and rows that already exist. Returns the number of assignments read.
+        """
+        memberships = ProjectPermission.objects.filter(project_id=OuterRef('task__project_id'), user_id=OuterRef('user_id'))
+        assignments = Task.users.through.objects.filter(**filters).filter(Exists(memberships)).values_list(
+            'user_id', 'task_id', 'task__project_id', 'task__end_datetime', 'task__status'
+        ).iterator(chunk_size=batch_size)
+
+        count = 0
+        while True:
+            batch = [
+                cls(user_id=user_id, task_id=task_id, project_id=project_id, end_datetime=end_datetime, status=status)
+                for user_id, task_id, project_id, end_datetime, status in itertools.islice(assignments, batch_size)
+            ]
+            if not batch:
+                return count
+            cls.objects.bulk_create(batch, ignore_conflicts=True)
+            count += len(batch)
+
+    @classmethod
+    def refresh_task(cls, task):
+        cls.objects.filter(task_id=task.id).update(
+            project_id=task.project_id, end_datetime=task.end_datetime, status=task.status
+        )
+
+    @classmethod
+    def rebuild(cls):
+        """Repopulates the table from Task.users and ProjectPermission and returns the number of rows."""
+        with transaction.atomic():
+            cls.objects.all().delete()
+            return cls.add_assignments()
+
+def task_file_upload_to(instance, filename):
+    # files/<project id modulo 256, in hex>/<project id>/, so neither level holds more than a few thousand entries;
+    # identical uploads are only shared within a project
+    if instance.project_id is None:
+        return f'files/shared/{filename}'
+    return f'files/{instance.project_id % 256:02x}/{instance.project_id}/{filename}'
+
+class FileQuerySet(models.QuerySet):
+    def delete_files(self):
+        """
+        Deletes the files' rows in one statement and their blobs once the transaction commits.
+
+        Storage is only touched after commit, on the background thread, so a rollback never loses a file
+        and the request does not wait for the disk. Blobs left behind by a crash are orphans, which
+        collect_orphaned_files removes.
+        """
+        from . import background
+
+        rows = list(self.values_list('pk', 'project_id', 'file', 'size'))
+        if not rows:
+            return 0, {}
+
+        released_at = time.time()
+        freed = {}
+        for pk, project_id, name, size in rows:
+            freed[project_id] = freed.get(project_id, 0) + size
+        names = [name for pk, project_id, name, size in rows]
+
+        with transaction.atomic():
+            # File has no delete signals or dependent rows, so this is a single DELETE
+            result = File.objects.filter(pk__in=[pk for pk, project_id, name, size in rows]).delete()
+            for project_id, size in freed.items():
+                if project_id is not None:
+                    Project.mark_changed(project_id, bytes_delta=-size)
+            transaction.on_commit(lambda: background.submit(File.release_blobs, names, released_at))
+        return result
+
 class File(models.Model):
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='project_files', null=True, blank=True)
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='task_files', null=True, blank=True)
-    file = models.FileField(upload_to='files/')
+    # Named after the content hash, so identical attachments share one blob; indexed to count its references
+    file = models.FileField(upload_to=task_file_upload_to, storage=task_file_storage, max_length=255, db_index=True)
+    original_name = models.CharField(max_length=255, blank=True)
+    # Name of the small JPEG preview next to the blob, empty until core.thumbnails has built it
+    thumbnail = models.CharField(max_length=255, blank=True, db_index=True, editable=False)
+    size = models.BigIntegerField(default=0, editable=False)
+
+    objects = FileQuerySet.as_manager()
 
     def __str__(self):
-        return self.file.name
+        return self.display_name
+
+    @property
+    def display_name(self):
+        return self.original_name or os.path.basename(self.file.name)
+
+    def save(self, *args, **kwargs):
+        # Task attachments always belong to the task's project
+        if self.project_id is None and self.task_id is not None:
+            self.project_id = self.task.project_id
+        is_new_upload = bool(self.file) and not self.file._committed
+        if is_new_upload:
+            self.size = self.file.size
+            if not self.original_name:
+                self.original_name = os.path.basename(self.file.name)
+        is_new = self._state.adding
+        super().save(*args, **kwargs)
+        Project.mark_changed(self.project_id, bytes_delta=self.size if is_new else 0)
     
     def delete(self, *args, **kwargs):
-        # Get the file path before deleting the model instance
-        file_path = self.file.path
-        super().delete(*args, **kwargs)
-        # Delete the associated file from the storage
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        return File.objects.filter(pk=self.pk).delete_files()
 
+    @staticmethod
+    def release_blobs(names, released_at):
+        """Deletes the blobs among names that no File row points to any more."""
+        names = [name for name in names if name]
+        referenced = set(File.objects.filter(file__in=names).values_list('file', flat=True))
+        for name in set(names) - referenced:
+            # A blob saved again after the rows were deleted is about to gain a new reference
+            if not task_file_storage.touched_since(name, released_at):
+                task_file_storage.delete(name)
+                task_file_storage.delete(thumbnail_name(name))
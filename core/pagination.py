@@ -0,0 +1,125 @@
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+# Range of the 64-bit integer columns primary keys and counters are stored in
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+
+class KeysetPage:
+    """
+    One page of a queryset ordered by (order_field, pk), fetched with a keyset cursor.
+
+    The cursor holds the sort value and pk of the last row shown, so later pages are
+    an index range scan starting after that row instead of an OFFSET over every earlier one.
+    Prefix order_field with '-' for descending order. Rows are only fetched when the page is used.
+    """
+
+    def __init__(self, queryset, order_field, cursor=None, page_size=50):
+        self.queryset = queryset
+        self.order_field = order_field
+        self.field_name = order_field.lstrip('-')
+        self.descending = order_field.startswith('-')
+        self.cursor = cursor
+        self.page_size = page_size
+        self._rows = None
+
+    def _fetch(self):
+        if self._rows is None:
+            queryset = self.queryset
+            position = self._decode_cursor(self.cursor)
+            if position is not None:
+                value, pk = position
+                after = 'lt' if self.descending else 'gt'
+                # The inclusive bound alone is what lets the database start an index range scan at the cursor;
+                # the OR only drops rows that tie with the cursor row
+                queryset = queryset.filter(
+                    **{f'{self.field_name}__{after}e': value}
+                ).filter(
+                    Q(**{f'{self.field_name}__{after}': value}) |
+                    Q(**{f'pk__{after}': pk})
+                )
+            pk_order = '-pk' if self.descending else 'pk'
+            # One extra row tells whether there is a next page
+            self._rows = list(queryset.order_by(self.order_field, pk_order)[:self.page_size + 1])
+        return self._rows
+
+    @property
+    def items(self):
+        return self._fetch()[:self.page_size]
+
+    @property
+    def has_next(self):
+        return len(self._fetch()) > self.page_size
+
+    @property
+    def next_cursor(self):
+        if not self.has_next:
+            return None
+        last = self.items[-1]
+        return self._encode_cursor(getattr(last, self.field_name), last.pk)
+
+    @property
+    def current_cursor(self):
+        # Re-encoded from the decoded position, so spellings of the same page agree and a malformed cursor is ''
+        position = self._decode_cursor(self.cursor)
+        if position is None:
+            return ''
+        return self._encode_cursor(*position)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def _encode_cursor(self, value, pk):
+        position = json.dumps([_to_json(value), pk])
+        return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+    def _decode_cursor(self, cursor):
+        # A malformed cursor falls back to the first page rather than failing the request
+        if not cursor:
+            return None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if value is None or type(pk) is not int:
+                return None
+            value = self._to_python(value)
+        except (ValueError, TypeError, OverflowError, ValidationError):
+            return None
+        # Integers the database cannot store would fail the query itself
+        if not _fits_int64(pk) or (isinstance(value, int) and not _fits_int64(value)):
+            return None
+        return value, pk
+
+    def _to_python(self, value):
+        try:
+            field = self.queryset.model._meta.get_field(self.field_name)
+        except FieldDoesNotExist:
+            # Annotations are converted by their output field, like model fields
+            annotation = self.queryset.query.annotations.get(self.field_name)
+            if annotation is None:
+                return value
+            field = annotation.output_field
+        value = field.to_python(value)
+        if value is None:
+            raise ValidationError("A cursor needs a sort value.")
+        return value
+
+
+def _fits_int64(value):
+    return _INT64_MIN <= value <= _INT64_MAX
+
+
+def _to_json(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
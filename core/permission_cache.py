@@ -0,0 +1,88 @@
+import threading
+import time
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+# Permission entries are keyed by a per-project version, so bumping the version
+# invalidates every cached permission of that project at once
+PERMISSION_CACHE_TIMEOUT = 60 * 60
+
+# Stored for users without a ProjectPermission row, since the cache cannot hold None
+NO_PERMISSION = ''
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def is_shared():
+    # A version bump only reaches the process it ran in with a local-memory cache, and every other worker
+    # would keep serving a revoked permission until it expired, so permissions are then not cached at all
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def _version_key(project_id):
+    return f'core:permission_version:{project_id}'
+
+
+def _permission_key(project_id, user_id, version):
+    return f'core:permission:{project_id}:{user_id}:{version}'
+
+
+def get_version(project_id):
+    key = _version_key(project_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1 so an evicted counter never reuses an old version
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(project_id):
+    try:
+        cache.incr(_version_key(project_id))
+    except ValueError:
+        cache.set(_version_key(project_id), time.time_ns(), None)
+
+
+def bump_version(project_id):
+    _bump(project_id)
+    # Bump again once the transaction commits, so readers that cached the old row
+    # while the transaction was open are invalidated as well
+    transaction.on_commit(lambda: _bump(project_id))
+
+
+def get_permission(project_id, user_id, loader):
+    """Returns the cached permission of a user, calling loader() on a miss or when the cache is not shared."""
+    if not is_shared():
+        return loader()
+
+    key = _permission_key(project_id, user_id, get_version(project_id))
+    permission = cache.get(key)
+    if permission is not None:
+        _record('hits')
+        return permission or None
+
+    _record('misses')
+    permission = loader()
+    cache.set(key, permission or NO_PERMISSION, PERMISSION_CACHE_TIMEOUT)
+    return permission
+
+
+def _record(counter):
+    with _stats_lock:
+        _stats[counter] += 1
+
+
+def get_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_stats():
+    with _stats_lock:
+        for counter in _stats:
+            _stats[counter] = 0
@@ -0,0 +1,77 @@
+from .models import ProjectPermission
+from . import permission_cache
+
+
+class PermissionResolver:
+    """Resolves a user's permission in a project, hitting the database at most once."""
+
+    def __init__(self, user, project_id):
+        self.user = user
+        self.project_id = int(project_id)
+        self._permission = None
+        self._loaded = False
+        self._manageable_members = None
+
+    @property
+    def permission(self):
+        if not self._loaded:
+            if self.user.is_authenticated:
+                self._permission = permission_cache.get_permission(
+                    self.project_id,
+                    self.user.id,
+                    self._load_permission
+                )
+            self._loaded = True
+        return self._permission
+
+    def _load_permission(self):
+        return ProjectPermission.objects.filter(
+            project_id=self.project_id,
+            user_id=self.user.id
+        ).values_list('permission', flat=True).first()
+
+    @property
+    def level(self):
+        return ProjectPermission.PERMISSION_LEVELS.get(self.permission, 0)
+
+    @property
+    def is_member(self):
+        return self.permission is not None
+
+    def has_permission(self, target_permission):
+        if not self.is_member:
+            return False
+        return self.level >= ProjectPermission.PERMISSION_LEVELS[target_permission]
+
+    @property
+    def flags(self):
+        # One boolean per permission level, e.g. flags['modify_tasks']
+        return {
+            permission: self.has_permission(permission)
+            for permission in ProjectPermission.PERMISSION_LEVELS
+        }
+
+    def manageable_members(self, project):
+        """Returns (id, username) of the members ranked below this user, computed in one query."""
+        if self._manageable_members is None:
+            self._manageable_members = list(
+                ProjectPermission.objects.with_level().filter(
+                    project_id=self.project_id,
+                    level__lt=self.level
+                ).exclude(
+                    user_id=self.user.id
+                ).exclude(
+                    user_id=project.creator_id
+                ).order_by('user_id').values_list('user_id', 'user__username')
+            )
+        return self._manageable_members
+
+
+def get_permission_resolver(request, project_id, user=None):
+    """Returns the resolver for (user, project) stored on the request, creating it if needed."""
+    user = user or request.user
+    resolvers = request.__dict__.setdefault('_permission_resolvers', {})
+    key = (user.id, int(project_id))
+    if key not in resolvers:
+        resolvers[key] = PermissionResolver(user, project_id)
+    return resolvers[key]
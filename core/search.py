@@ -0,0 +1,109 @@
+import re
+
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+# FTS5 index over Task.name and Task.description, keyed by the task's id as rowid
+FTS_TABLE = 'core_task_fts'
+
+# Control characters mark highlighted terms, so they can be swapped for <mark> after escaping
+_HIGHLIGHT_START = '\x02'
+_HIGHLIGHT_END = '\x03'
+
+
+def is_supported():
+    return connection.vendor == 'sqlite'
+
+
+def create_index(schema_editor):
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+        "USING fts5(name, description, project_id UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+    )
+
+
+def drop_index(schema_editor):
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def index_task(task):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [task.id])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description, project_id) VALUES (%s, %s, %s, %s)",
+            [task.id, task.name, task.description, task.project_id]
+        )
+
+
+def unindex_task(task_id):
+    if not is_supported():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [task_id])
+
+
+def unindex_tasks(task_ids):
+    if not is_supported() or not task_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(task_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", list(task_ids))
+
+
+def rebuild_index():
+    """Repopulates the index from the Task table and returns the number of tasks indexed."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description, project_id) "
+            "SELECT id, name, description, project_id FROM core_task"
+        )
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def build_match_query(text):
+    # Quote every word so user input cannot inject FTS5 syntax, and prefix-match each of them
+    terms = re.findall(r'\w+', text)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_tasks(project_id, text, limit=50):
+    """Returns the best matching tasks of a project, with highlighted name and description snippet."""
+    match_query = build_match_query(text)
+    if not match_query or not is_supported():
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid, "
+            f"highlight({FTS_TABLE}, 0, %s, %s), "
+            f"snippet({FTS_TABLE}, 1, %s, %s, '…', 16) "
+            f"FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND project_id = %s "
+            f"ORDER BY rank LIMIT %s",
+            [
+                _HIGHLIGHT_START, _HIGHLIGHT_END,
+                _HIGHLIGHT_START, _HIGHLIGHT_END,
+                match_query, project_id, limit
+            ]
+        )
+        rows = cursor.fetchall()
+
+    return [
+        {
+            'task_id': task_id,
+            'name': _highlighted(name),
+            'snippet': _highlighted(snippet),
+        }
+        for task_id, name, snippet in rows
+    ]
+
+
+def _highlighted(text):
+    text = escape(text or '')
+    return mark_safe(text.replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_END, '</mark>'))
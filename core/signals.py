@@ -0,0 +1,66 @@
+from django.db.models.signals import pre_delete, post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Project, Task, TaskDeadline, File
+from . import search, thumbnails
+
+
+@receiver(post_save, sender=Task)
+def index_saved_task(sender, instance, created, **kwargs):
+    search.index_task(instance)
+    if not created:
+        # A new task has no assignees yet; rows of a deleted task go with it through the foreign key
+        TaskDeadline.refresh_task(instance)
+    Project.mark_changed(instance.project_id)
+
+
+@receiver(post_save, sender=File)
+def schedule_thumbnail(sender, instance, created, **kwargs):
+    # Only a save signal: File keeps no delete receivers, so queryset deletes of files stay single statements
+    if created:
+        thumbnails.schedule(instance)
+
+
+@receiver(pre_delete, sender=Task)
+def delete_task_files(sender, instance, **kwargs):
+    # The cascade would delete the rows directly; delete_files also lowers the project's storage usage
+    # and releases the blobs once the deletion commits
+    File.objects.filter(task=instance).delete_files()
+
+
+@receiver(pre_delete, sender=Project)
+def delete_project_files(sender, instance, **kwargs):
+    # Also covers files without a task, and projects deleted through their creator's cascade
+    File.objects.filter(project=instance).delete_files()
+
+
+@receiver(post_delete, sender=Task)
+def unindex_deleted_task(sender, instance, **kwargs):
+    search.unindex_task(instance.id)
+    Project.mark_changed(instance.project_id)
+
+
+@receiver(m2m_changed, sender=Task.users.through)
+def mark_assignees_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        Project.mark_changed(instance.project_id)
+    elif pk_set:
+        # Changed from the user's side, so pk_set holds task ids
+        project_ids = Task.objects.filter(pk__in=pk_set).values_list('project_id', flat=True).distinct()
+        for project_id in project_ids:
+            Project.mark_changed(project_id)
+
+
+@receiver(m2m_changed, sender=Task.users.through)
+def sync_task_deadlines(sender, instance, action, reverse, pk_set, **kwargs):
+    # From the user's side instance is a user and pk_set holds task ids
+    owner, other = ('user', 'task') if reverse else ('task', 'user')
+    if action == 'post_add' and pk_set:
+        TaskDeadline.add_assignments(**{owner: instance, f'{other}_id__in': pk_set})
+    elif action == 'post_remove' and pk_set:
+        TaskDeadline.objects.filter(**{owner: instance, f'{other}_id__in': pk_set}).delete()
+    elif action == 'post_clear':
+        TaskDeadline.objects.filter(**{owner: instance}).delete()
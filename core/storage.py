@@ -0,0 +1,83 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+def content_hash(content):
+    """Returns the SHA-256 hex digest of a Django File, reading it chunk by chunk."""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every upload under the SHA-256 of its content, so identical attachments share one blob.
+
+    The name an upload is saved under only contributes its directory and extension, below which
+    blobs are spread over subdirectories named after the first two hex digits of the hash. A blob that
+    already exists is not written again; File rows pointing at the same name are its references.
+    """
+
+    def blob_name(self, name, digest):
+        # Blobs fan out by the first byte of their hash, so no directory grows past a few hundred entries per project
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], f"{digest}{extension}").replace(os.sep, '/')
+
+    def get_available_name(self, name, max_length=None):
+        # Equal names mean equal content, so there is nothing to make unique
+        return name
+
+    def _save(self, name, content):
+        # The hash is read before anything is written, so a duplicate upload costs no write I/O
+        digest = getattr(content, 'sha256', None) or content_hash(content)
+        name = self.blob_name(name, digest)
+        full_path = self.path(name)
+
+        if os.path.exists(full_path):
+            self.touch(name)
+            return name
+
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if hasattr(content, 'temporary_file_path'):
+            # Large uploads are already on disk, they are moved rather than copied
+            file_move_safe(content.temporary_file_path(), full_path, allow_overwrite=True)
+        else:
+            # Written next to the blob and renamed into place, so a concurrent reader never sees a partial file;
+            # two uploads of the same content racing here write identical bytes
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+            try:
+                with os.fdopen(fd, 'wb') as temp_file:
+                    for chunk in content.chunks():
+                        temp_file.write(chunk)
+                os.replace(temp_path, full_path)
+            except BaseException:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return name
+
+    def touch(self, name):
+        # Saving touches a blob, so a release running concurrently can tell it was just reused
+        os.utime(self.path(name))
+
+    def touched_since(self, name, timestamp):
+        try:
+            return os.path.getmtime(self.path(name)) >= timestamp
+        except FileNotFoundError:
+            return False
+
+
+task_file_storage = ContentAddressedStorage()
@@ -1,38 +1,15 @@
 from django import template
-from core.models import ProjectPermission
+from core.permissions import PermissionResolver, get_permission_resolver
 
 register = template.Library()
 
-@register.simple_tag
-def has_permission(user, permission, project_id):
-    project_permission = ProjectPermission.objects.filter(
-        project__id=project_id,
-        project__users=user,
-        user=user
-    ).first()
+@register.simple_tag(takes_context=True)
+def has_permission(context, user, permission, project_id):
+    # Every call on a page shares the request's resolver, so the permission row is loaded once
+    request = context.get('request')
+    if request is not None:
+        resolver = get_permission_resolver(request, project_id, user=user)
+    else:
+        resolver = PermissionResolver(user, project_id)
 
-    if project_permission:
-        return project_permission.has_permission(permission)
-
-    return False
-
-@register.simple_tag
-def get_project_permission(user, project):
-    project_permission = user.project_permissions.filter(project_id=project.id).first()
-    if project_permission:
-        return project_permission.get_permission_display()
-    return "No permission found"
-
-@register.simple_tag
-def get_project_permission_level(user, project):
-    project_permission = user.project_permissions.filter(project_id=project.id).first()
-    if project_permission:
-        return project_permission.permission_level
-    return "N/A"
-
-@register.simple_tag
-def get_user_profile(user, project):
-    user_profile = user.profiles.filter(project_id=project.id).first()
-    if user_profile:
-        return user_profile
-    return "N/A"
\ No newline at end of file
+    return resolver.has_permission(permission)
@@ -0,0 +1,95 @@
+from io import StringIO
+from unittest import mock
+from django.test import TestCase
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from ..models import Project, Task, TaskDeadline
+from ..deletion import purge_project
+
+
+# Unit Tests for the Task Deadline Table
+
+class TaskDeadlineTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', password='ownerpassword')
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.project = Project.objects.create(name='Test Project', creator=self.owner)
+        self.project.addUser(self.user)
+        self.task = Task.objects.create(project=self.project, name='Test Task', description='Task', start_datetime='2023-07-24 10:00Z',
+                                        end_datetime='2023-07-24 12:00Z', status='Not yet started')
+
+    def deadlines(self):
+        return set(TaskDeadline.objects.values_list('user_id', 'task_id', 'project_id', 'status'))
+
+    def test_assignment_adds_row(self):
+        self.task.users.add(self.user)
+        self.assertEqual(self.deadlines(), {(self.user.id, self.task.id, self.project.id, 'Not yet started')})
+        self.assertEqual(TaskDeadline.objects.get().end_datetime, Task.objects.get().end_datetime)
+
+    def test_assignment_from_user_side(self):
+        self.user.tasks.add(self.task)
+        self.assertEqual(self.deadlines(), {(self.user.id, self.task.id, self.project.id, 'Not yet started')})
+        self.user.tasks.remove(self.task)
+        self.assertEqual(self.deadlines(), set())
+        self.user.tasks.add(self.task)
+        self.user.tasks.clear()
+        self.assertEqual(self.deadlines(), set())
+
+    def test_non_member_gets_no_row(self):
+        outsider = User.objects.create_user(username='outsider', password='outsiderpassword')
+        self.task.users.add(outsider)
+        self.assertEqual(self.deadlines(), set())
+
+    def test_unassignment_removes_row(self):
+        self.task.users.add(self.user, self.owner)
+        self.task.users.remove(self.owner)
+        self.assertEqual(self.deadlines(), {(self.user.id, self.task.id, self.project.id, 'Not yet started')})
+        self.task.users.set([])
+        self.assertEqual(self.deadlines(), set())
+        self.task.users.add(self.user)
+        self.task.users.clear()
+        self.assertEqual(self.deadlines(), set())
+
+    def test_task_changes_are_copied(self):
+        self.task.users.add(self.user)
+        self.task.end_datetime = '2023-08-01 12:00Z'
+        self.task.status = 'Completed'
+        self.task.save()
+        deadline = TaskDeadline.objects.get()
+        self.assertEqual(deadline.status, 'Completed')
+        self.assertEqual(deadline.end_datetime, Task.objects.get().end_datetime)
+
+    def test_task_deletion_removes_rows(self):
+        self.task.users.add(self.user)
+        self.task.delete_task()
+        self.assertEqual(self.deadlines(), set())
+
+    def test_membership_changes(self):
+        self.task.users.add(self.user)
+        self.project.removeUser(self.user)
+        self.assertEqual(self.deadlines(), set())
+        # The assignment outlives the membership, so rejoining brings the row back
+        self.project.addUser(self.user)
+        self.assertEqual(self.deadlines(), {(self.user.id, self.task.id, self.project.id, 'Not yet started')})
+
+    def test_purge_removes_rows(self):
+        self.task.users.add(self.user)
+        with mock.patch('core.background.submit'):
+            self.project.delete_project()
+        self.assertEqual(list(TaskDeadline.objects.agenda(self.user)), [])
+        purge_project(self.project.id)
+        self.assertEqual(self.deadlines(), set())
+
+    def test_rebuild_command(self):
+        other = Task.objects.create(project=self.project, name='Other Task', description='Task', start_datetime='2023-07-24 10:00Z',
+                                    end_datetime='2023-07-25 12:00Z', status='In-process')
+        self.task.users.add(self.user, self.owner)
+        other.users.add(self.user)
+        expected = self.deadlines()
+        TaskDeadline.objects.all().delete()
+        TaskDeadline.objects.create(user=self.user, task=self.task, project=self.project, end_datetime=self.task.end_datetime, status='Completed')
+
+        out = StringIO()
+        call_command('rebuild_task_deadlines', stdout=out)
+        self.assertIn('Recorded 3 task deadlines', out.getvalue())
+        self.assertEqual(self.deadlines(), expected)
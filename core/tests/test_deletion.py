@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from ..models import Project, Task, ProjectPermission, File
+from ..deletion import purge_project
+from .. import search
+
+
+# Unit Tests for Project Deletion
+
+class ProjectDeletionTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.member = User.objects.create_user(username='member', password='memberpassword')
+        self.project = Project.objects.create(name='Test Project', creator=self.user)
+        self.project.addUser(self.member)
+        self.other_project = Project.objects.create(name='Other Project', creator=self.user)
+
+        self.paths = []
+        for i in range(5):
+            task = Task.objects.create(project=self.project, name=f'Quarterly task {i}', description='Quarterly figures',
+                                       start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+            task.users.add(self.member)
+            file_obj = File.objects.create(task=task, file=ContentFile(b'content', name=f'file_{i}.txt'))
+            self.paths.append(file_obj.file.path)
+        self.other_task = Task.objects.create(project=self.other_project, name='Quarterly task', description='Quarterly figures',
+                                              start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_delete_project_hides_project_and_schedules_purge(self):
+        with mock.patch('core.background.submit') as submit:
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertNumQueries(1):
+                    self.project.delete_project()
+
+        self.assertFalse(Project.objects.filter(pk=self.project.pk).exists())
+        self.assertTrue(Project.all_objects.filter(pk=self.project.pk, is_deleting=True).exists())
+        self.assertNotIn(self.project, self.user.created_projects.all())
+        submit.assert_called_once_with(purge_project, self.project.pk)
+
+    def test_purge_project_in_batches(self):
+        self.project.delete_project()
+        purge_project(self.project.pk, batch_size=2)
+
+        self.assertFalse(Project.all_objects.filter(pk=self.project.pk).exists())
+        self.assertFalse(Task.objects.filter(project_id=self.project.pk).exists())
+        self.assertFalse(File.objects.filter(task__project_id=self.project.pk).exists())
+        self.assertFalse(ProjectPermission.objects.filter(project_id=self.project.pk).exists())
+        self.assertFalse(any(os.path.exists(path) for path in self.paths))
+        self.assertEqual([result['task_id'] for result in search.search_tasks(self.project.pk, 'quarterly')], [])
+
+        # The other project is untouched
+        self.assertEqual([result['task_id'] for result in search.search_tasks(self.other_project.pk, 'quarterly')], [self.other_task.id])
+        self.assertTrue(self.other_project.users.filter(pk=self.user.pk).exists())
+
+    def test_purge_ignores_projects_not_marked_as_deleting(self):
+        purge_project(self.project.pk)
+        self.assertTrue(Project.objects.filter(pk=self.project.pk).exists())
+        self.assertEqual(Task.objects.filter(project=self.project).count(), 5)
+
+    def test_purge_deleted_projects_command(self):
+        self.project.delete_project()
+        call_command('purge_deleted_projects', stdout=StringIO())
+        self.assertFalse(Project.all_objects.filter(pk=self.project.pk).exists())
+
+    def test_deleteproject_view(self):
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        with mock.patch('core.background.submit'):
+            response = client.post(reverse('core:deleteproject', args=[self.project.id]))
+        self.assertRedirects(response, reverse('core:myprojects'))
+
+        response = client.get(reverse('core:project', args=[self.project.id]))
+        self.assertEqual(response.status_code, 404)
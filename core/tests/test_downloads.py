@@ -0,0 +1,159 @@
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User
+from ..models import Project, Task, File
+from ..downloads import parse_range, FILE_DOWNLOAD_CHUNK_SIZE
+
+
+# Unit Tests for Attachment Downloads
+
+class DownloadFileTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.project = Project.objects.create(name='Test Project', creator=self.user)
+        self.file = File.objects.create(project=self.project, file=SimpleUploadedFile('report.txt', b'0123456789'))
+        self.url = reverse('core:downloadfile', args=[self.project.id, self.file.id])
+        self.client = Client()
+        self.client.login(username='testuser', password='testpassword')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def content(self, response):
+        content = b''.join(response.streaming_content)
+        response.close()
+        return content
+
+    def test_download(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), b'0123456789')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="report.txt"')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('private', response['Cache-Control'])
+        self.assertTrue(response['ETag'].startswith('"'))
+
+    def test_if_none_match(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(response['Content-Length'], '3')
+        self.assertEqual(self.content(response), b'234')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(self.content(response), b'789')
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_stale_if_range_sends_whole_file(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), b'0123456789')
+
+    def test_parse_range(self):
+        self.assertEqual(parse_range('bytes=0-', 10), (0, 9))
+        self.assertEqual(parse_range('bytes=5-100', 10), (5, 9))
+        self.assertIsNone(parse_range('bytes=0-1,4-5', 10))
+        self.assertIsNone(parse_range('items=0-1', 10))
+        self.assertFalse(parse_range('bytes=-0', 10))
+        self.assertFalse(parse_range('bytes=-5', 0))
+        self.assertFalse(parse_range('bytes=0-', 0))
+
+    def test_non_member_is_redirected(self):
+        User.objects.create_user(username='outsider', password='outsiderpassword')
+        client = Client()
+        client.login(username='outsider', password='outsiderpassword')
+        response = client.get(self.url)
+        self.assertRedirects(response, reverse('core:myprojects'))
+
+    def test_file_of_other_project_is_not_found(self):
+        other_project = Project.objects.create(name='Other Project', creator=self.user)
+        response = self.client.get(reverse('core:downloadfile', args=[other_project.id, self.file.id]))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(FILE_DOWNLOAD_MODE='x-accel-redirect')
+    def test_accel_redirect_mode(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.file.file.name)
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response.content, b'')
+
+class ZipDownloadTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.project = Project.objects.create(name='Test Project', creator=self.user)
+        self.task = Task.objects.create(project=self.project, name='Write report', description='Quarterly figures',
+                                        start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+        File.objects.create(task=self.task, file=SimpleUploadedFile('notes.txt', b'first notes'))
+        File.objects.create(task=self.task, file=SimpleUploadedFile('notes.txt', b'second notes'))
+        File.objects.create(project=self.project, file=SimpleUploadedFile('../plan.txt', b'plan'))
+        self.client = Client()
+        self.client.login(username='testuser', password='testpassword')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def archive(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        chunks = list(response.streaming_content)
+        response.close()
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(chunks)))
+        self.assertIsNone(archive.testzip())
+        return {info.filename: archive.read(info) for info in archive.infolist()}
+
+    def test_project_zip(self):
+        response = self.client.get(reverse('core:downloadprojectfiles', args=[self.project.id]))
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="Test Project.zip"')
+        folder = f'Write report ({self.task.id})'
+        self.assertEqual(self.archive(response), {
+            f'{folder}/notes.txt': b'first notes',
+            f'{folder}/notes (2).txt': b'second notes',
+            'plan.txt': b'plan',
+        })
+
+    def test_task_zip(self):
+        response = self.client.get(reverse('core:downloadtaskfiles', args=[self.project.id, self.task.id]))
+        self.assertEqual(self.archive(response), {'notes.txt': b'first notes', 'notes (2).txt': b'second notes'})
+
+    def test_large_file_is_streamed_in_blocks(self):
+        content = os.urandom(3 * FILE_DOWNLOAD_CHUNK_SIZE)
+        File.objects.create(task=self.task, file=SimpleUploadedFile('large.bin', content))
+        response = self.client.get(reverse('core:downloadtaskfiles', args=[self.project.id, self.task.id]))
+        chunks = list(response.streaming_content)
+        response.close()
+        self.assertGreater(len(chunks), 3)
+        self.assertTrue(all(len(chunk) <= 2 * FILE_DOWNLOAD_CHUNK_SIZE for chunk in chunks))
+        self.assertEqual(zipfile.ZipFile(io.BytesIO(b''.join(chunks))).read('large.bin'), content)
+
+    def test_non_member_is_redirected(self):
+        User.objects.create_user(username='outsider', password='outsiderpassword')
+        client = Client()
+        client.login(username='outsider', password='outsiderpassword')
+        response = client.get(reverse('core:downloadprojectfiles', args=[self.project.id]))
+        self.assertRedirects(response, reverse('core:myprojects'))
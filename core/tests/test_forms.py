@@ -1,7 +1,8 @@
 from django.test import TestCase, RequestFactory
+from django.db import connection
 from django.contrib.auth.models import User
 from ..models import Project, Task, ProjectPermission, UserProfile, File
-from ..forms import AddProjectForm, AddTaskForm, BulkModifyPermissionForm, BulkRemoveUserForm, ChangeTaskStatusForm, ModifyTaskForm, UserProfileForm
+from ..forms import AddProjectForm, AddTaskForm, BulkModifyPermissionForm, BulkRemoveUserForm, ChangeTaskStatusForm, ModifyTaskForm, UserProfileForm, TaskFilterForm
 import os
 
 
@@ -93,6 +94,23 @@ class BulkModifyPermissionFormTest(TestCase):
         form = BulkModifyPermissionForm(project=self.project, request=request, data=form_data)
         self.assertFalse(form.is_valid())
 
+    def test_choices_are_members_below_current_user(self):
+        request = RequestFactory().get('/')
+        request.user = self.user2
+        form = BulkModifyPermissionForm(project=self.project, request=request)
+        self.assertEqual(list(form.fields['selected_users'].choices), [(self.user3.id, 'user3')])
+
+    def test_forms_share_eligible_members(self):
+        for i in range(10):
+            self.project.addUser(User.objects.create(username=f'member{i}'))
+        request = RequestFactory().get('/')
+        request.user = self.user1
+        with self.assertNumQueries(2):  # Current user's permission, then every eligible member
+            modify_form = BulkModifyPermissionForm(project=self.project, request=request)
+            remove_form = BulkRemoveUserForm(project=self.project, request=request)
+        self.assertEqual(len(modify_form.fields['selected_users'].choices), 12)
+        self.assertEqual(modify_form.fields['selected_users'].choices, remove_form.fields['selected_users'].choices)
+
 class BulkRemoveUserFormTest(TestCase):
     def setUp(self):
         self.user1 = User.objects.create_user(username='user1', password='password1')
@@ -192,7 +210,7 @@ class UserProfileFormTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='testpassword')
         self.project = Project.objects.create(name='Test Project', creator=self.user)
-        self.user_profile = UserProfile.objects.create(user=self.user, project=self.project)
+        self.user_profile = UserProfile.objects.get(user=self.user, project=self.project)
 
     def test_form_valid1(self):
         form_data = {
@@ -232,4 +250,58 @@ class UserProfileFormTest(TestCase):
             'email_address': 'examplegmail.com',
         }
         form = UserProfileForm(instance=self.user_profile, data=form_data)
-        self.assertFalse(form.is_valid())
\ No newline at end of file
+        self.assertFalse(form.is_valid())
+
+
+class TaskFilterFormTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.other_user = User.objects.create(username='otheruser')
+        self.project = Project.objects.create(name='Test Project', creator=self.user)
+        self.project.addUser(self.other_user)
+        self.early_task = Task.objects.create(project=self.project, name='Early Task', description='Test Description',
+                                              start_datetime='2023-06-01 10:00Z', end_datetime='2023-06-05 12:00Z', status='Completed')
+        self.late_task = Task.objects.create(project=self.project, name='Late Task', description='Test Description',
+                                             start_datetime='2023-07-01 10:00Z', end_datetime='2023-07-05 12:00Z', status='In-process')
+        self.late_task.users.add(self.other_user)
+
+    def filtered(self, data):
+        form = TaskFilterForm(data, project=self.project)
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.filter_tasks(self.project.tasks.all())
+
+    def explain(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    def test_filter_by_status(self):
+        self.assertEqual(list(self.filtered({'status': 'Completed'})), [self.early_task])
+
+    def test_filter_by_assignee(self):
+        self.assertEqual(list(self.filtered({'assignee': self.other_user.id})), [self.late_task])
+
+    def test_filter_by_overlapping_window(self):
+        self.assertEqual(list(self.filtered({'start': '2023-06-04T00:00', 'end': '2023-06-20T00:00'})), [self.early_task])
+        self.assertEqual(list(self.filtered({'start': '2023-06-04T00:00', 'end': '2023-07-02T00:00'}).order_by('id')), [self.early_task, self.late_task])
+
+    def test_filter_query_holds_validated_values_only(self):
+        form = TaskFilterForm({'assignee': self.other_user.id, 'start': '2023-06-04 00:00', 'utm_source': 'mail'}, project=self.project)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.filter_query(), f'assignee={self.other_user.id}&start=2023-06-04T00%3A00%3A00')
+
+    def test_assignee_must_be_project_member(self):
+        outsider = User.objects.create(username='outsider')
+        form = TaskFilterForm({'assignee': outsider.id}, project=self.project)
+        self.assertFalse(form.is_valid())
+
+    def test_status_filter_uses_index(self):
+        plan = self.explain(self.filtered({'status': 'Completed'}).order_by('status', 'id'))
+        self.assertIn('USING INDEX core_task_project_status_idx (project_id=? AND status=?)', plan)
+        self.assertNotIn('SCAN core_task', plan)
+
+    def test_date_window_filter_uses_index(self):
+        plan = self.explain(self.filtered({'start': '2023-06-04T00:00', 'end': '2023-06-20T00:00'}).order_by('end_datetime', 'id'))
+        self.assertIn('USING INDEX core_task_project_end_idx (project_id=? AND end_datetime>?)', plan)
+        self.assertNotIn('SCAN core_task', plan)
@@ -0,0 +1,234 @@
+import hashlib
+import io
+import os
+import threading
+import shutil
+import tempfile
+import time
+from concurrent.futures import Future
+from io import StringIO
+from unittest import mock, skipUnless
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from ..models import Project, File
+from .. import imaging, thumbnails
+
+
+# Unit Tests for Media Maintenance
+
+class CollectOrphanedFilesTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.project = Project.objects.create(name='Test Project', creator=self.user)
+        self.kept = File.objects.create(project=self.project, file=ContentFile(b'kept', name='kept.txt'))
+
+        os.makedirs(os.path.join(self.media_root, 'files', 'nested'))
+        self.orphan = self.write_file('files/nested/orphan.txt', age=7200)
+        self.fresh_orphan = self.write_file('files/fresh.txt', age=0)
+        self.age(self.kept.file.path, 7200)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def write_file(self, name, age):
+        path = os.path.join(self.media_root, name)
+        with open(path, 'wb') as f:
+            f.write(b'orphan')
+        self.age(path, age)
+        return path
+
+    def age(self, path, seconds):
+        mtime = time.time() - seconds
+        os.utime(path, (mtime, mtime))
+
+    def run_command(self, *args):
+        out = StringIO()
+        call_command('collect_orphaned_files', '--batch-size', '1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_only_reports(self):
+        output = self.run_command('--dry-run')
+        self.assertIn('files/nested/orphan.txt', output)
+        self.assertNotIn('kept', output)
+        self.assertNotIn('fresh.txt', output)
+        self.assertTrue(os.path.exists(self.orphan))
+
+    def test_removes_old_orphans_only(self):
+        output = self.run_command()
+        self.assertIn('Removed 1 orphaned files', output)
+        self.assertFalse(os.path.exists(self.orphan))
+        self.assertTrue(os.path.exists(self.fresh_orphan))
+        self.assertTrue(os.path.exists(self.kept.file.path))
+
+    def test_min_age(self):
+        self.run_command('--min-age', '0')
+        self.assertFalse(os.path.exists(self.fresh_orphan))
+        self.assertTrue(os.path.exists(self.kept.file.path))
+
+class ContentAddressedStorageTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.project = Project.objects.create(name='Test Project', creator=self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def blobs(self):
+        return sorted(name for directory, _, names in os.walk(os.path.join(self.media_root, 'files')) for name in names)
+
+    def blob_name(self, content, extension):
+        digest = hashlib.sha256(content).hexdigest()
+        return f'files/{self.project.id % 256:02x}/{self.project.id}/{digest[:2]}/{digest}{extension}'
+
+    def test_identical_uploads_share_one_blob(self):
+        first = File.objects.create(project=self.project, file=SimpleUploadedFile('spec.PDF', b'same content'))
+        second = File.objects.create(project=self.project, file=SimpleUploadedFile('spec copy.pdf', b'same content'))
+        other = File.objects.create(project=self.project, file=SimpleUploadedFile('other.pdf', b'other content'))
+
+        self.assertEqual(first.file.name, self.blob_name(b'same content', '.pdf'))
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertNotEqual(other.file.name, first.file.name)
+        self.assertEqual(len(self.blobs()), 2)
+        self.assertEqual((first.display_name, second.display_name), ('spec.PDF', 'spec copy.pdf'))
+
+    def test_large_uploads_are_moved_into_place(self):
+        upload = TemporaryUploadedFile('big.bin', 'application/octet-stream', 5, None)
+        upload.write(b'large')
+        upload.seek(0)
+        file_obj = File.objects.create(project=self.project, file=upload)
+        upload.close()
+        self.assertEqual(file_obj.file.name, self.blob_name(b'large', '.bin'))
+        with file_obj.file.open('rb') as f:
+            self.assertEqual(f.read(), b'large')
+
+    def test_blob_is_kept_while_referenced(self):
+        first = File.objects.create(project=self.project, file=SimpleUploadedFile('a.txt', b'shared'))
+        second = File.objects.create(project=self.project, file=SimpleUploadedFile('b.txt', b'shared'))
+        path = first.file.path
+
+        with mock.patch('core.background.submit', side_effect=run_now):
+            with self.captureOnCommitCallbacks(execute=True):
+                first.delete()
+            self.assertTrue(os.path.exists(path))
+            with self.captureOnCommitCallbacks(execute=True):
+                second.delete()
+        self.assertFalse(os.path.exists(path))
+
+    def test_shard_media_files_command(self):
+        # A row from before content addressing, in the old flat directory
+        legacy = File.objects.create(project=self.project, file=SimpleUploadedFile('legacy.txt', b'legacy'))
+        os.makedirs(os.path.join(self.media_root, 'files'), exist_ok=True)
+        legacy_path = os.path.join(self.media_root, 'files', 'legacy_Ab12Cd.txt')
+        os.rename(legacy.file.path, legacy_path)
+        File.objects.filter(pk=legacy.pk).update(file='files/legacy_Ab12Cd.txt')
+        current = File.objects.create(project=self.project, file=SimpleUploadedFile('current.txt', b'current'))
+
+        out = StringIO()
+        call_command('shard_media_files', '--batch-size', '1', stdout=out)
+        self.assertIn('Moved 1 files', out.getvalue())
+
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.file.name, self.blob_name(b'legacy', '.txt'))
+        with legacy.file.open('rb') as f:
+            self.assertEqual(f.read(), b'legacy')
+        self.assertFalse(os.path.exists(legacy_path))
+        self.assertEqual(File.objects.get(pk=current.pk).file.name, current.file.name)
+
+        # Rerunning after completion finds nothing left to move
+        out = StringIO()
+        call_command('shard_media_files', stdout=out)
+        self.assertIn('Moved 0 files', out.getvalue())
+
+@skipUnless(imaging.is_available(), "Thumbnails require Pillow")
+class ThumbnailTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.project = Project.objects.create(name='Test Project', creator=self.user)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def png(self, name='screenshot.png', size=(1600, 900)):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGBA', size, (255, 0, 0, 128)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def test_build_thumbnails_command(self):
+        file_obj = File.objects.create(project=self.project, file=self.png())
+        text = File.objects.create(project=self.project, file=SimpleUploadedFile('notes.txt', b'notes'))
+        call_command('build_thumbnails', stdout=StringIO())
+
+        file_obj.refresh_from_db()
+        self.assertEqual(file_obj.thumbnail, thumbnails.thumbnail_name(file_obj.file.name))
+        from PIL import Image
+        with Image.open(file_obj.file.storage.path(file_obj.thumbnail)) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (320, 180))
+        self.assertEqual(File.objects.get(pk=text.pk).thumbnail, '')
+
+    def test_upload_is_rendered_after_commit(self):
+        executor = mock.Mock()
+        executor.submit.side_effect = lambda func, *args: _completed(func(*args))
+        with mock.patch('core.thumbnails._get_executor', return_value=executor), \
+                mock.patch('core.background.submit', side_effect=run_now):
+            with self.captureOnCommitCallbacks(execute=True):
+                file_obj = File.objects.create(project=self.project, file=self.png())
+                executor.submit.assert_not_called()
+        file_obj.refresh_from_db()
+        self.assertTrue(file_obj.thumbnail)
+
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        response = client.get(reverse('core:downloadfile', args=[self.project.id, file_obj.id]), {'variant': 'thumbnail'})
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        response.close()
+
+    def test_full_queue_skips_rendering(self):
+        executor = mock.Mock()
+        with mock.patch('core.thumbnails._get_executor', return_value=executor), \
+                mock.patch('core.thumbnails._slots', threading.BoundedSemaphore(1)) as slots:
+            slots.acquire()
+            with self.assertLogs('core.thumbnails', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+                File.objects.create(project=self.project, file=self.png())
+        executor.submit.assert_not_called()
+
+    def test_thumbnail_is_released_with_blob(self):
+        file_obj = File.objects.create(project=self.project, file=self.png())
+        call_command('build_thumbnails', stdout=StringIO())
+        file_obj.refresh_from_db()
+        thumbnail_path = file_obj.file.storage.path(file_obj.thumbnail)
+        self.assertTrue(os.path.exists(thumbnail_path))
+        with mock.patch('core.background.submit', side_effect=run_now):
+            with self.captureOnCommitCallbacks(execute=True):
+                file_obj.delete()
+        self.assertFalse(os.path.exists(thumbnail_path))
+
+
+def run_now(func, *args, **kwargs):
+    func(*args, **kwargs)
+
+
+def _completed(result):
+    future = Future()
+    future.set_result(result)
+    return future
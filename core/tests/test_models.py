@@ -1,5 +1,9 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
+from django.db import connection, IntegrityError
+from django.utils import timezone
+from datetime import timedelta
+from unittest import mock
 from ..models import Project, Task, ProjectPermission, UserProfile, File
 import os
 
@@ -20,6 +24,21 @@ class ProjectModelTest(TestCase):
         self.project.addUser(new_user)
         self.assertTrue(self.project.users.filter(id=new_user.id).exists())
 
+    def test_add_user_keeps_existing_membership(self):
+        new_user = User.objects.create_user(username='newuser', password='newpassword')
+        self.project.addUser(new_user)
+        self.project.updatePermission(new_user, 'modify_tasks')
+        self.project.addUser(new_user)
+        self.assertEqual(ProjectPermission.objects.get(project=self.project, user=new_user).permission, 'modify_tasks')
+        self.assertEqual(ProjectPermission.objects.get(project=self.project, user=self.user).permission, 'creator')
+
+    def test_add_users(self):
+        members = [User.objects.create(username=f'member{i}') for i in range(100)]
+        with self.assertNumQueries(5):  # SAVEPOINT, INSERT, assignments to restore, project change marker, RELEASE SAVEPOINT
+            self.project.add_users(members)
+        self.assertEqual(self.project.users.count(), 101)
+        self.assertEqual(ProjectPermission.objects.filter(project=self.project, permission='read').count(), 100)
+
     def test_remove_user(self):
         self.project.removeUser(self.user)
         self.assertFalse(self.project.users.filter(id=self.user.id).exists())
@@ -30,12 +49,78 @@ class ProjectModelTest(TestCase):
         project_permission = ProjectPermission.objects.filter(project=self.project, user=self.user).first()
         self.assertEqual(project_permission.permission, permission)
 
+    def test_update_permissions(self):
+        members = [User.objects.create(username=f'member{i}') for i in range(20)]
+        for member in members:
+            self.project.addUser(member)
+        member_ids = [member.id for member in members]
+        with self.assertNumQueries(4):  # SAVEPOINT, UPDATE, project change marker, RELEASE SAVEPOINT
+            self.project.update_permissions(member_ids, 'modify_tasks')
+        self.assertEqual(ProjectPermission.objects.filter(project=self.project, permission='modify_tasks').count(), 20)
+        self.assertEqual(ProjectPermission.objects.get(project=self.project, user=self.user).permission, 'creator')
+
+    def test_save_from_stale_copy_keeps_counters(self):
+        stale = Project.objects.get(pk=self.project.pk)
+        Project.mark_changed(self.project.pk, bytes_delta=500)
+        self.project.rotate_invite_code()
+        with mock.patch('core.background.submit'):
+            self.project.delete_project()
+
+        stale.name = 'Renamed Project'
+        stale.save()
+        project = Project.all_objects.get(pk=self.project.pk)
+        self.assertEqual(project.name, 'Renamed Project')
+        self.assertEqual(project.bytes_used, 500)
+        self.assertTrue(project.is_deleting)
+        self.assertEqual(project.invite_code, self.project.invite_code)
+
+    def test_remove_users(self):
+        members = [User.objects.create(username=f'member{i}') for i in range(20)]
+        for member in members:
+            self.project.addUser(member)
+        member_ids = [member.id for member in members]
+        with self.assertNumQueries(5):  # SAVEPOINT, DELETE, DELETE of their deadlines, project change marker, RELEASE SAVEPOINT
+            self.project.remove_users(member_ids)
+        self.assertEqual(list(self.project.users.all()), [self.user])
+        self.assertFalse(UserProfile.objects.filter(project=self.project, user_id__in=member_ids).exists())
+
     def test_save_new_project(self):
         project = Project(name='New Project', creator=self.user)
         project.save()
         self.assertIsNotNone(project.invite_code)
         self.assertTrue(ProjectPermission.objects.filter(project=project, user=self.user, permission='creator').exists())
 
+    def test_invite_codes_are_unique(self):
+        with self.assertRaises(IntegrityError):
+            Project.objects.create(name='Copy', creator=self.user, invite_code=self.project.invite_code)
+
+    def test_invite_code_collision_is_redrawn(self):
+        with mock.patch('core.models.generate_invite_code', side_effect=[self.project.invite_code, 'fresh01']):
+            project = Project.objects.create(name='New Project', creator=self.user)
+        self.assertEqual(Project.objects.get(pk=project.pk).invite_code, 'fresh01')
+        self.assertTrue(ProjectPermission.objects.filter(project=project, user=self.user, permission='creator').exists())
+
+    def test_rotate_invite_code(self):
+        old_code = self.project.invite_code
+        expires_at = timezone.now() + timedelta(days=1)
+        new_code = self.project.rotate_invite_code(expires_at=expires_at)
+        self.assertNotEqual(new_code, old_code)
+        self.assertFalse(Project.by_invite_code(old_code).exists())
+        self.assertEqual(Project.by_invite_code(new_code).get(), self.project)
+
+    def test_expired_invite_code_matches_nothing(self):
+        self.project.rotate_invite_code(expires_at=timezone.now() - timedelta(minutes=1))
+        self.assertFalse(Project.by_invite_code(self.project.invite_code).exists())
+
+    def test_invite_code_lookup_uses_index(self):
+        query = Project.by_invite_code('abc1234').query
+        sql, params = query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+        self.assertIn('USING INDEX', plan)
+        self.assertNotIn('SCAN', plan)
+
     def test_save_existing_project(self):
         project = Project.objects.create(name='Existing Project', creator=self.user)
         project.name = 'Updated Project'
@@ -115,9 +200,33 @@ class FileModelTest(TestCase):
         file_obj = File.objects.create(project=self.project, file=file)
         file_path = file_obj.file.path
         self.assertTrue(os.path.exists(file_path))
-        file_obj.delete()
+        with mock.patch('core.background.submit', side_effect=run_now):
+            with self.captureOnCommitCallbacks(execute=True):
+                file_obj.delete()
+                # Storage is only touched once the transaction commits
+                self.assertTrue(os.path.exists(file_path))
         self.assertFalse(os.path.exists(file_path))
 
+    def test_delete_files(self):
+        from django.core.files.base import ContentFile
+        files = [File.objects.create(task=self.task, file=ContentFile(f'content {i}'.encode(), name=f'file_{i}.txt')) for i in range(5)]
+        paths = [file_obj.file.path for file_obj in files]
+        with mock.patch('core.background.submit') as submit:
+            with self.captureOnCommitCallbacks() as callbacks:
+                with self.assertNumQueries(5):  # SELECT, SAVEPOINT, DELETE, project counter, RELEASE SAVEPOINT
+                    File.objects.filter(task=self.task).delete_files()
+            self.assertTrue(all(os.path.exists(path) for path in paths))
+            self.assertEqual(Project.objects.get(pk=self.project.pk).bytes_used, 0)
+
+            for callback in callbacks:
+                callback()
+            func, *args = submit.call_args.args
+            func(*args)
+        self.assertFalse(any(os.path.exists(path) for path in paths))
+
+def run_now(func, *args, **kwargs):
+    func(*args, **kwargs)
+
 class UserProfileModelTest(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='testpassword')
@@ -139,6 +248,15 @@ class UserProfileModelTest(TestCase):
         with self.assertRaises(UserProfile.DoesNotExist):
             UserProfile.objects.get(user=new_user, project=self.project)
 
+    def test_profile_is_stored_on_membership(self):
+        profile = UserProfile.objects.get(user=self.user, project=self.project)
+        profile.display_name = 'Tester'
+        profile.save()
+        project_permission = ProjectPermission.objects.get(user=self.user, project=self.project)
+        self.assertEqual(project_permission.pk, profile.pk)
+        self.assertEqual(project_permission.display_name, 'Tester')
+        self.assertEqual(project_permission.permission, 'creator')
+
     def test_profile_str_representation(self):
         new_user = User.objects.create_user(username='newuser', password='newpassword')
         self.project.addUser(new_user)
@@ -0,0 +1,118 @@
+import shutil
+import tempfile
+from django.test import TestCase, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.contrib.auth.models import User
+from ..models import Project, ProjectPermission
+from ..permissions import PermissionResolver, get_permission_resolver
+from .. import permission_cache
+
+
+# Unit Tests for Permission Resolution
+
+class PermissionResolverTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.project = Project.objects.create(name='Test Project', creator=self.user)
+        self.member = User.objects.create_user(username='member', password='memberpassword')
+        self.project.addUser(self.member)
+        self.project.updatePermission(self.member, 'modify_tasks')
+
+    def test_flags(self):
+        resolver = PermissionResolver(self.member, self.project.id)
+        flags = resolver.flags
+        self.assertEqual(set(flags), set(ProjectPermission.PERMISSION_LEVELS))
+        self.assertTrue(flags['read'])
+        self.assertTrue(flags['modify_tasks'])
+        self.assertFalse(flags['delete_tasks'])
+        self.assertFalse(flags['creator'])
+
+    def test_non_member_has_no_permissions(self):
+        outsider = User.objects.create_user(username='outsider', password='outsiderpassword')
+        resolver = PermissionResolver(outsider, self.project.id)
+        self.assertFalse(resolver.is_member)
+        self.assertFalse(any(resolver.flags.values()))
+
+    def test_resolver_loads_once(self):
+        resolver = PermissionResolver(self.user, self.project.id)
+        with self.assertNumQueries(1):
+            for permission in ProjectPermission.PERMISSION_LEVELS:
+                self.assertTrue(resolver.has_permission(permission))
+
+    def test_resolver_is_shared_per_request(self):
+        request = RequestFactory().get('/')
+        request.user = self.member
+        self.assertIs(
+            get_permission_resolver(request, self.project.id),
+            get_permission_resolver(request, str(self.project.id))
+        )
+
+    def test_project_page_loads_permission_once(self):
+        client = Client()
+        client.login(username='member', password='memberpassword')
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(reverse('core:project', args=[self.project.id]))
+        self.assertEqual(response.status_code, 200)
+        permission_queries = [
+            query for query in queries.captured_queries
+            if 'FROM "core_projectpermission"' in query['sql']
+        ]
+        self.assertEqual(len(permission_queries), 1)
+
+class PermissionCacheTest(TestCase):
+    def setUp(self):
+        # A file-based cache is shared by every process on the host, so permissions are cached in it
+        self.cache_dir = tempfile.mkdtemp()
+        self.settings_override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': self.cache_dir,
+        }})
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.project = Project.objects.create(name='Test Project', creator=self.user)
+        self.member = User.objects.create_user(username='member', password='memberpassword')
+        self.project.addUser(self.member)
+        permission_cache.reset_stats()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_second_request_is_served_from_cache(self):
+        PermissionResolver(self.member, self.project.id).permission
+        with self.assertNumQueries(0):
+            self.assertEqual(PermissionResolver(self.member, self.project.id).permission, 'read')
+        self.assertEqual(permission_cache.get_stats(), {'hits': 1, 'misses': 1})
+
+    def test_non_member_is_cached(self):
+        outsider = User.objects.create_user(username='outsider', password='outsiderpassword')
+        PermissionResolver(outsider, self.project.id).permission
+        with self.assertNumQueries(0):
+            self.assertIsNone(PermissionResolver(outsider, self.project.id).permission)
+
+    def test_update_permission_invalidates_cache(self):
+        PermissionResolver(self.member, self.project.id).permission
+        self.project.updatePermission(self.member, 'delete_tasks')
+        self.assertEqual(PermissionResolver(self.member, self.project.id).permission, 'delete_tasks')
+
+    def test_remove_user_invalidates_cache(self):
+        PermissionResolver(self.member, self.project.id).permission
+        self.project.removeUser(self.member)
+        self.assertFalse(PermissionResolver(self.member, self.project.id).is_member)
+
+    def test_add_user_invalidates_cache(self):
+        newcomer = User.objects.create_user(username='newcomer', password='newcomerpassword')
+        self.assertFalse(PermissionResolver(newcomer, self.project.id).is_member)
+        self.project.addUser(newcomer)
+        self.assertTrue(PermissionResolver(newcomer, self.project.id).has_permission('read'))
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_process_local_cache_is_not_used(self):
+        self.assertFalse(permission_cache.is_shared())
+        PermissionResolver(self.member, self.project.id).permission
+        # Another worker's revocation would never reach this process's cache, so every resolver reads the database
+        with self.assertNumQueries(1):
+            self.assertEqual(PermissionResolver(self.member, self.project.id).permission, 'read')
+        self.assertEqual(permission_cache.get_stats(), {'hits': 0, 'misses': 0})
@@ -0,0 +1,75 @@
+from io import StringIO
+from django.test import TestCase, Client
+from django.urls import reverse
+from django.db import connection
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from ..models import Project, Task
+from .. import search
+
+
+# Unit Tests for Task Search
+
+class TaskSearchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.project = Project.objects.create(name='Test Project', creator=self.user)
+        self.task = Task.objects.create(project=self.project, name='Write <b>report</b>', description='Summarise the quarterly figures for the board',
+                                        start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+
+    def task_ids(self, text, project=None):
+        return [result['task_id'] for result in search.search_tasks((project or self.project).id, text)]
+
+    def test_task_is_indexed_on_save(self):
+        self.assertEqual(self.task_ids('quarterly'), [self.task.id])
+        self.assertEqual(self.task_ids('quart'), [self.task.id])
+
+    def test_index_follows_updates(self):
+        self.task.description = 'Prepare the slides'
+        self.task.save()
+        self.assertEqual(self.task_ids('quarterly'), [])
+        self.assertEqual(self.task_ids('slides'), [self.task.id])
+
+    def test_task_is_unindexed_on_delete(self):
+        self.task.delete_task()
+        self.assertEqual(self.task_ids('quarterly'), [])
+
+    def test_search_is_scoped_to_project(self):
+        other_project = Project.objects.create(name='Other Project', creator=self.user)
+        self.assertEqual(self.task_ids('quarterly', other_project), [])
+
+    def test_results_are_ranked(self):
+        better = Task.objects.create(project=self.project, name='Quarterly figures', description='Quarterly figures, quarterly review',
+                                     start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+        self.assertEqual(self.task_ids('quarterly figures'), [better.id, self.task.id])
+
+    def test_highlights_are_escaped(self):
+        result = search.search_tasks(self.project.id, 'report')[0]
+        self.assertEqual(result['name'], 'Write &lt;b&gt;<mark>report</mark>&lt;/b&gt;')
+        self.assertIn('<mark>quarterly</mark>', search.search_tasks(self.project.id, 'quarterly')[0]['snippet'])
+
+    def test_query_syntax_is_not_interpreted(self):
+        self.assertEqual(self.task_ids('quarterly AND NOT "'), [])
+        self.assertEqual(self.task_ids('figures)*('), [self.task.id])
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {search.FTS_TABLE}")
+        self.assertEqual(self.task_ids('quarterly'), [])
+        call_command('rebuild_task_search', stdout=StringIO())
+        self.assertEqual(self.task_ids('quarterly'), [self.task.id])
+
+    def test_searchtasks_view(self):
+        client = Client()
+        response = client.get(reverse('core:searchtasks', args=[self.project.id]), {'q': 'quarterly'})
+        self.assertEqual(response.status_code, 302)
+
+        client.login(username='testuser', password='testpassword')
+        response = client.get(reverse('core:searchtasks', args=[self.project.id]), {'q': 'quarterly'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['task_id'] for result in response.context['results']], [self.task.id])
+
+        User.objects.create_user(username='outsider', password='outsiderpassword')
+        client.login(username='outsider', password='outsiderpassword')
+        response = client.get(reverse('core:searchtasks', args=[self.project.id]), {'q': 'quarterly'})
+        self.assertEqual(response.status_code, 302)
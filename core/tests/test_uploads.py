@@ -0,0 +1,218 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from importlib import import_module
+from unittest import mock
+from django.apps import apps
+from django.test import TestCase, Client, override_settings
+from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.models import User
+from ..models import Project, Task, File
+from ..uploads import QuotaExceeded
+
+
+# Unit Tests for Uploads and Storage Quotas
+
+@override_settings(FILE_UPLOAD_MAX_SIZE=None, PROJECT_STORAGE_QUOTA=None)
+class UploadTestCase(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.project = Project.objects.create(name='Test Project', creator=self.user)
+        self.task = Task.objects.create(project=self.project, name='Test Task', description='This is a test task',
+                                        start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def bytes_used(self):
+        return Project.objects.values_list('bytes_used', flat=True).get(pk=self.project.pk)
+
+    def blobs(self):
+        return [name for directory, _, names in os.walk(self.media_root) for name in names]
+
+class StorageUsageTest(UploadTestCase):
+    def test_counter_follows_file_writes(self):
+        first = File.objects.create(task=self.task, file=SimpleUploadedFile('a.txt', b'12345'))
+        File.objects.create(task=self.task, file=SimpleUploadedFile('b.txt', b'123'))
+        self.assertEqual(first.size, 5)
+        self.assertEqual(self.bytes_used(), 8)
+
+        first.delete()
+        self.assertEqual(self.bytes_used(), 3)
+
+    @override_settings(PROJECT_STORAGE_QUOTA=10)
+    def test_add_files_is_all_or_nothing(self):
+        self.task.add_files([SimpleUploadedFile('a.txt', b'123456')])
+        with self.assertRaises(QuotaExceeded):
+            self.task.add_files([SimpleUploadedFile('b.txt', b'abc'), SimpleUploadedFile('c.txt', b'defgh')])
+
+        self.assertEqual(list(self.task.task_files.values_list('original_name', flat=True)), ['a.txt'])
+        self.assertEqual(self.bytes_used(), 6)
+        self.assertEqual(len(self.blobs()), 1)
+
+    def test_failed_add_files_only_releases_saved_blobs(self):
+        save = File.save
+
+        def save_until_b(file_obj, *args, **kwargs):
+            if file_obj.file.name == 'b.txt':
+                raise OSError("disk full")
+            return save(file_obj, *args, **kwargs)
+
+        with mock.patch.object(File, 'save', autospec=True, side_effect=save_until_b):
+            with mock.patch.object(File, 'release_blobs', wraps=File.release_blobs) as release_blobs:
+                with self.assertRaises(OSError):
+                    self.task.add_files([SimpleUploadedFile('a.txt', b'abc'), SimpleUploadedFile('b.txt', b'def')])
+
+        released = release_blobs.call_args[0][0]
+        self.assertEqual(len(released), 1)
+        self.assertTrue(released[0].endswith(hashlib.sha256(b'abc').hexdigest() + '.txt'))
+        self.assertEqual(self.blobs(), [])
+
+    def test_recount_includes_files_known_only_by_their_task(self):
+        File.objects.create(project=self.project, file=SimpleUploadedFile('a.txt', b'12345'))
+        legacy = File.objects.create(task=self.task, file=SimpleUploadedFile('b.txt', b'123'))
+        File.objects.filter(pk=legacy.pk).update(project=None)
+        Project.objects.filter(pk=self.project.pk).update(bytes_used=0)
+
+        recount = import_module('core.migrations.0027_recount_storage_usage').recount_storage_usage
+        recount(apps, None)
+        self.assertEqual(self.bytes_used(), 8)
+
+    @override_settings(PROJECT_STORAGE_QUOTA=10)
+    def test_quota_check_reads_no_files(self):
+        self.task.add_files([SimpleUploadedFile('a.txt', b'123456')])
+        self.project.refresh_from_db()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.project.remaining_bytes(), 4)
+
+def run_now(func, *args, **kwargs):
+    func(*args, **kwargs)
+
+class UploadViewTest(UploadTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = Client()
+        self.client.login(username='testuser', password='testpassword')
+
+    def post_task(self, *files, client=None):
+        data = {
+            'name': 'Uploaded Task',
+            'description': 'With attachments',
+            'start_datetime': '2023-07-24 10:00',
+            'end_datetime': '2023-07-24 12:00',
+            'status': 'Not yet started',
+            'users': [self.user.id],
+            'new_files': list(files),
+        }
+        return (client or self.client).post(reverse('core:addtask', args=[self.project.id]), data)
+
+    def test_files_are_saved_once_with_their_hash(self):
+        response = self.post_task(SimpleUploadedFile('spec.txt', b'spec'), SimpleUploadedFile('spec copy.txt', b'spec'))
+        self.assertEqual(response.status_code, 302)
+
+        task = Task.objects.get(name='Uploaded Task')
+        files = list(task.task_files.all())
+        self.assertEqual(len(files), 2)
+        self.assertTrue(files[0].file.name.endswith(hashlib.sha256(b'spec').hexdigest() + '.txt'))
+        self.assertEqual(len(self.blobs()), 1)
+        self.assertEqual(self.bytes_used(), 8)
+
+    @override_settings(FILE_UPLOAD_MAX_SIZE=10)
+    def test_file_over_size_limit_is_rejected(self):
+        response = self.post_task(SimpleUploadedFile('big.txt', b'x' * 11))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('big.txt is larger than 10', response.context['form'].errors['new_files'][0])
+        self.assertFalse(Task.objects.filter(name='Uploaded Task').exists())
+        self.assertEqual(self.blobs(), [])
+
+    @override_settings(PROJECT_STORAGE_QUOTA=10)
+    def test_upload_over_project_quota_is_rejected(self):
+        File.objects.create(task=self.task, file=SimpleUploadedFile('a.txt', b'123456'))
+        response = self.post_task(SimpleUploadedFile('b.txt', b'12345'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('remaining 4', response.context['form'].errors['new_files'][0])
+        self.assertFalse(Task.objects.filter(name='Uploaded Task').exists())
+        self.assertEqual(self.bytes_used(), 6)
+
+    def test_csrf_is_still_enforced(self):
+        client = Client(enforce_csrf_checks=True)
+        client.login(username='testuser', password='testpassword')
+        response = self.post_task(SimpleUploadedFile('a.txt', b'123'), client=client)
+        self.assertEqual(response.status_code, 403)
+
+    def test_modifytask_deletes_and_adds_files_together(self):
+        old = File.objects.create(task=self.task, file=SimpleUploadedFile('old.txt', b'old'))
+        data = {
+            'name': 'Test Task',
+            'description': 'This is a test task',
+            'start_datetime': '2023-07-24 10:00',
+            'end_datetime': '2023-07-24 12:00',
+            'status': 'Not yet started',
+            'users': [self.user.id],
+            'files_to_delete': [old.id],
+            'new_files': [SimpleUploadedFile('new.txt', b'newer')],
+        }
+        response = self.client.post(reverse('core:modifytask', args=[self.project.id, self.task.id]), data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(list(self.task.task_files.values_list('original_name', flat=True)), ['new.txt'])
+        self.assertEqual(self.bytes_used(), 5)
+
+    @override_settings(PROJECT_STORAGE_QUOTA=10)
+    def test_modifytask_over_quota_changes_nothing(self):
+        old = File.objects.create(task=self.task, file=SimpleUploadedFile('old.txt', b'old'))
+        data = {
+            'name': 'Renamed Task',
+            'description': 'This is a test task',
+            'start_datetime': '2023-07-24 10:00',
+            'end_datetime': '2023-07-24 12:00',
+            'status': 'Not yet started',
+            'users': [self.user.id],
+            'files_to_delete': [old.id],
+            'new_files': [SimpleUploadedFile('new.txt', b'x' * 11)],
+        }
+        # Lets the upload through, as a concurrent upload could, so the check on saving has to catch it
+        with mock.patch.object(Project, 'remaining_bytes', return_value=None):
+            response = self.client.post(reverse('core:modifytask', args=[self.project.id, self.task.id]), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('remaining storage', response.context['form'].errors['new_files'][0])
+        self.assertEqual(Task.objects.get(pk=self.task.pk).name, 'Test Task')
+        self.assertEqual(list(self.task.task_files.values_list('original_name', flat=True)), ['old.txt'])
+        self.assertEqual(self.bytes_used(), 3)
+        self.assertEqual(len(self.blobs()), 1)
+
+    def test_deletetask_frees_storage(self):
+        file_obj = File.objects.create(task=self.task, file=SimpleUploadedFile('a.txt', b'x' * 1000))
+        self.assertEqual(self.bytes_used(), 1000)
+
+        with mock.patch('core.background.submit', side_effect=run_now):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('core:deletetask', args=[self.project.id, self.task.id]))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(File.objects.filter(pk=file_obj.pk).exists())
+        self.assertEqual(self.bytes_used(), 0)
+        self.assertEqual(self.blobs(), [])
+
+    def test_cascades_release_blobs(self):
+        File.objects.create(project=self.project, file=SimpleUploadedFile('a.txt', b'project file'))
+        File.objects.create(task=self.task, file=SimpleUploadedFile('b.txt', b'task file'))
+        other = Project.objects.create(name='Other Project', creator=self.user)
+        File.objects.create(project=other, file=SimpleUploadedFile('c.txt', b'other file'))
+        self.assertEqual(len(self.blobs()), 3)
+
+        with mock.patch('core.background.submit', side_effect=run_now):
+            with self.captureOnCommitCallbacks(execute=True):
+                Project.objects.filter(pk=self.project.pk).delete()
+            self.assertEqual(len(self.blobs()), 1)
+
+            # The creator's projects go with their account
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.delete()
+        self.assertFalse(File.objects.exists())
+        self.assertEqual(self.blobs(), [])
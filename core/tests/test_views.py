@@ -1,7 +1,17 @@
+import base64
+import json
 from django.test import TestCase, Client
 from django.urls import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.http import http_date
+from datetime import timedelta
+import time
+from unittest import mock
 from django.contrib.auth.models import User
-from ..models import Project, Task, ProjectPermission, UserProfile, File
+from ..models import Project, Task, TaskDeadline, ProjectPermission, UserProfile, File
 
 
 # Unit Tests for Views
@@ -64,6 +74,236 @@ class ViewsTest(TestCase):
         self.assertEqual(response.context['project'], project)
         self.assertEqual(list(response.context['tasks']), list(project.tasks.all()))
 
+    def test_project_view_query_count_is_constant(self):
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        project = Project.objects.create(name='Test Project', creator=self.user)
+
+        def add_tasks(count):
+            for i in range(count):
+                task = Task.objects.create(project=project, name=f'Task {i}', description='This is a test task',
+                                           start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+                task.users.add(self.user)
+                File.objects.create(project=project, task=task, file=f'files/task{i}.txt')
+
+        def count_queries():
+            cache.clear()  # Measure a full render rather than the cached task table
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(reverse('core:project', args=[project.id]))
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        add_tasks(1)
+        baseline = count_queries()
+        add_tasks(30)
+        self.assertEqual(count_queries(), baseline)
+
+    def test_project_view_rejects_unknown_sort(self):
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        project = Project.objects.create(name='Test Project', creator=self.user)
+        for sort in ['--status', 'name', '-']:
+            response = client.get(reverse('core:project', args=[project.id]), {'sort': sort})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context['sort'], 'start_datetime')
+        response = client.get(reverse('core:project', args=[project.id]), {'sort': '-status'})
+        self.assertEqual(response.context['sort'], '-status')
+
+    def test_crafted_cursors_fall_back_to_first_page(self):
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        project = Project.objects.create(name='Test Project', creator=self.user)
+        task = Task.objects.create(project=project, name='Test Task', description='This is a test task',
+                                   start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+        task.users.add(self.user)
+
+        def cursor(position):
+            return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip('=')
+
+        urls = [reverse('core:home'), reverse('core:project', args=[project.id]), reverse('core:allusers', args=[project.id])]
+        for position in [[None, 1], ['2023-07-24T12:00:00+00:00', 10 ** 30], [1, 10 ** 30], ['2023-07-24T12:00:00+00:00', '1'],
+                         ['not a number', 1], [[1], 1], [10 ** 30, 1]]:
+            for url in urls:
+                response = client.get(url, {'cursor': cursor(position)})
+                self.assertEqual(response.status_code, 200, (url, position))
+
+        response = client.get(urls[1], {'cursor': cursor([None, 1])})
+        self.assertEqual([task.name for task in response.context['tasks']], ['Test Task'])
+        # member_id is an annotation, converted by its output field
+        response = client.get(urls[2], {'cursor': cursor(['not a number', 1])})
+        self.assertEqual([member.username for member in response.context['users']], ['testuser'])
+
+    def test_project_view_keyset_pagination(self):
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        project = Project.objects.create(name='Test Project', creator=self.user)
+        # Repeated end dates check that rows sharing a sort value are neither skipped nor repeated
+        for i in range(5):
+            Task.objects.create(project=project, name=f'Task {i}', description='This is a test task',
+                                start_datetime='2023-07-24 10:00Z', end_datetime=f'2023-07-2{5 + i // 2} 12:00Z', status='Not yet started')
+
+        def collect(sort):
+            names, cursor = [], None
+            while True:
+                params = {'sort': sort}
+                if cursor:
+                    params['cursor'] = cursor
+                response = client.get(reverse('core:project', args=[project.id]), params)
+                page = response.context['tasks']
+                self.assertLessEqual(len(page), 2)
+                names += [task.name for task in page]
+                cursor = page.next_cursor
+                if not cursor:
+                    return names
+
+        with mock.patch('core.views.TASK_PAGE_SIZE', 2):
+            self.assertEqual(collect('end_datetime'), [f'Task {i}' for i in range(5)])
+            self.assertEqual(collect('-end_datetime'), [f'Task {i}' for i in reversed(range(5))])
+
+    def test_project_view_shows_filter_errors(self):
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        project = Project.objects.create(name='Test Project', creator=self.user)
+        Task.objects.create(project=project, name='Test Task', description='This is a test task',
+                            start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+
+        response = client.get(reverse('core:project', args=[project.id]), {'status': 'Completed', 'start': 'not a date'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('start', response.context['filter_form'].errors)
+        self.assertContains(response, 'Enter a valid date/time.')
+        self.assertEqual(list(response.context['tasks']), [])
+
+    def test_project_view_conditional_get(self):
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        project = Project.objects.create(name='Test Project', creator=self.user)
+        url = reverse('core:project', args=[project.id])
+
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse([query for query in queries.captured_queries if 'core_task' in query['sql']])
+
+        task = Task.objects.create(project=project, name='Test Task', description='This is a test task',
+                                   start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        task.users.add(self.user)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_project_view_ignores_if_modified_since(self):
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        project = Project.objects.create(name='Test Project', creator=self.user)
+        url = reverse('core:project', args=[project.id])
+
+        response = client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        # Changes within the same second as the last response must not be answered with 304
+        Task.objects.create(project=project, name='Test Task', description='This is a test task',
+                            start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+        response = client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, 200)
+
+    def test_project_pages_change_with_rename(self):
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        project = Project.objects.create(name='Test Project', creator=self.user)
+        task = Task.objects.create(project=project, name='Test Task', description='This is a test task',
+                                   start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+        urls = [reverse('core:project', args=[project.id]), reverse('core:allusers', args=[project.id]),
+                reverse('core:taskproperties', args=[project.id, task.id])]
+        etags = [client.get(url)['ETag'] for url in urls]
+
+        response = client.post(reverse('core:updateprojectname', args=[project.id]), {'project_name': 'Renamed Project'})
+        self.assertEqual(response.status_code, 302)
+        for url, etag in zip(urls, etags):
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertContains(client.get(urls[0]), 'Renamed Project')
+
+    def test_member_pages_change_with_membership(self):
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        project = Project.objects.create(name='Test Project', creator=self.user)
+        task = Task.objects.create(project=project, name='Test Task', description='This is a test task',
+                                   start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+        urls = [reverse('core:allusers', args=[project.id]), reverse('core:taskproperties', args=[project.id, task.id])]
+        etags = [client.get(url)['ETag'] for url in urls]
+
+        for url, etag in zip(urls, etags):
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        project.addUser(User.objects.create(username='newuser'))
+        for url, etag in zip(urls, etags):
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        profile = UserProfile.objects.get(project=project, user=self.user)
+        etags = [client.get(url)['ETag'] for url in urls]
+        profile.display_name = 'Tester'
+        profile.save()
+        for url, etag in zip(urls, etags):
+            self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_task_table_is_shared_between_members(self):
+        project = Project.objects.create(name='Test Project', creator=self.user)
+        task = Task.objects.create(project=project, name='Test Task', description='This is a test task',
+                                   start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+        task.users.add(self.user)
+        for username in ['member1', 'member2', 'manager']:
+            User.objects.create_user(username=username, password='memberpassword')
+            project.addUser(User.objects.get(username=username))
+        project.updatePermission(User.objects.get(username='manager'), 'delete_tasks')
+        url = reverse('core:project', args=[project.id])
+
+        def task_queries(username):
+            client = Client()
+            client.login(username=username, password='memberpassword')
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return response, [query for query in queries.captured_queries if 'core_task' in query['sql']]
+
+        response, queries = task_queries('member1')
+        self.assertTrue(queries)
+        response, queries = task_queries('member2')
+        self.assertEqual(queries, [])
+        self.assertContains(response, 'Test Task')
+        self.assertNotContains(response, 'Modify Task')
+
+        # A member who sees the action columns gets their own copy of the table
+        response, queries = task_queries('manager')
+        self.assertTrue(queries)
+        self.assertContains(response, 'Modify Task')
+
+        Task.objects.create(project=project, name='Another Task', description='This is a test task',
+                            start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+        response, queries = task_queries('member2')
+        self.assertTrue(queries)
+        self.assertContains(response, 'Another Task')
+
+    def test_task_table_cache_ignores_unknown_parameters(self):
+        project = Project.objects.create(name='Test Project', creator=self.user)
+        Task.objects.create(project=project, name='Test Task', description='This is a test task',
+                            start_datetime='2023-07-24 10:00Z', end_datetime='2023-07-24 12:00Z', status='Not yet started')
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        url = reverse('core:project', args=[project.id])
+
+        client.get(url, {'status': 'Not yet started'})
+        for noise in [{'utm_source': 'mail'}, {'cursor': 'garbage'}, {'status': 'Not yet started', 'page': '7'}]:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url, {'status': 'Not yet started', **noise})
+            self.assertContains(response, 'Test Task')
+            self.assertFalse([query for query in queries.captured_queries if 'core_task' in query['sql']], noise)
+        self.assertNotContains(response, 'page=7')
+
     def test_myprojects_view(self):
         client = Client()
 
@@ -92,6 +332,36 @@ class ViewsTest(TestCase):
 
         self.assertTrue(project.users.filter(id=self.user.id).exists())
 
+    def test_joinproject_view_rejects_expired_code(self):
+        client = Client()
+        project = Project.objects.create(name='Test Project', creator=self.user)
+        project.rotate_invite_code(expires_at=timezone.now() - timedelta(days=1))
+        User.objects.create_user(username='newcomer', password='newcomerpassword')
+        client.login(username='newcomer', password='newcomerpassword')
+
+        response = client.get(reverse('core:joinproject', args=[project.invite_code]))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(project.users.filter(username='newcomer').exists())
+
+    def test_rotateinvitecode_view(self):
+        client = Client()
+        project = Project.objects.create(name='Test Project', creator=self.user)
+        old_code = project.invite_code
+        member = User.objects.create_user(username='member', password='memberpassword')
+        project.addUser(member)
+
+        client.login(username='member', password='memberpassword')
+        client.post(reverse('core:rotateinvitecode', args=[project.id]), {'expires_in': '7'})
+        project.refresh_from_db()
+        self.assertEqual(project.invite_code, old_code)
+
+        client.login(username='testuser', password='testpassword')
+        response = client.post(reverse('core:rotateinvitecode', args=[project.id]), {'expires_in': '7'})
+        self.assertRedirects(response, reverse('core:project_management', args=[project.id]))
+        project.refresh_from_db()
+        self.assertNotEqual(project.invite_code, old_code)
+        self.assertGreater(project.invite_code_expires_at, timezone.now() + timedelta(days=6))
+
     def test_allusers_view(self):
         client = Client()
 
@@ -112,6 +382,53 @@ class ViewsTest(TestCase):
         self.assertEqual(response.context['project'], project)
         self.assertEqual(list(response.context['users']), list(project.users.all()))
 
+    def test_allusers_view_single_query_directory(self):
+        client = Client()
+        project = Project.objects.create(name='Test Project', creator=self.user)
+        profile = UserProfile.objects.get(project=project, user=self.user)
+        profile.display_name = 'Tester'
+        profile.role = 'Developer'
+        profile.save()
+        client.login(username='testuser', password='testpassword')
+        url = reverse('core:allusers', args=[project.id])
+
+        def directory_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return response, [query for query in queries.captured_queries if 'FROM "auth_user"' in query['sql'] and 'core_projectpermission' in query['sql']]
+
+        response, queries = directory_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertContains(response, 'Tester')
+        self.assertContains(response, 'Developer')
+        self.assertContains(response, 'Creator')
+
+        for i in range(10):
+            project.addUser(User.objects.create(username=f'member{i}'))
+        response, queries = directory_queries()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(len(response.context['users']), 11)
+        member = [user for user in response.context['users'] if user.username == 'member0'][0]
+        self.assertEqual((member.permission, member.permission_level, member.display_name), ('read', 1, None))
+
+    def test_allusers_view_pagination(self):
+        client = Client()
+        project = Project.objects.create(name='Test Project', creator=self.user)
+        for i in range(4):
+            project.addUser(User.objects.create(username=f'member{i}'))
+        client.login(username='testuser', password='testpassword')
+
+        usernames, cursor = [], None
+        with mock.patch('core.views.MEMBER_PAGE_SIZE', 2):
+            while True:
+                response = client.get(reverse('core:allusers', args=[project.id]), {'cursor': cursor} if cursor else {})
+                usernames += [user.username for user in response.context['users']]
+                cursor = response.context['users'].next_cursor
+                if not cursor:
+                    break
+        self.assertEqual(usernames, ['testuser'] + [f'member{i}' for i in range(4)])
+
     def test_addtask_view(self):
         client = Client()
 
@@ -192,16 +509,31 @@ class ViewsTest(TestCase):
         self.assertEqual(user_profile.phone_number, '+6590224812')
         self.assertEqual(user_profile.email_address, 'updated@example.com')
 
+    def test_user_management_query_count_is_constant(self):
+        client = Client()
+        client.login(username='testuser', password='testpassword')
+        project = Project.objects.create(name='Test Project', creator=self.user)
+
+        def count_queries():
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(reverse('core:user_management', args=[project.id]))
+            self.assertEqual(response.status_code, 200)
+            return len(queries)
+
+        project.addUser(User.objects.create(username='member0'))
+        baseline = count_queries()
+        project.add_users([User.objects.create(username=f'member{i}') for i in range(1, 20)])
+        self.assertEqual(count_queries(), baseline)
+        self.assertContains(client.get(reverse('core:user_management', args=[project.id])), 'member19')
+
     def test_user_management_view(self):
         client = Client()
 
         project = Project.objects.create(name='Test Project', creator=self.user)
         user1 = User.objects.create_user(username='user1', password='user1password')
         user2 = User.objects.create_user(username='user2', password='user2password')
-        ProjectPermission.objects.create(project=project, user=user1, permission='read')
-        ProjectPermission.objects.create(project=project, user=user2, permission='add_users')
-        UserProfile.objects.create(user=user1, project=project, display_name='User 1')
-        UserProfile.objects.create(user=user2, project=project, display_name='User 2')
+        ProjectPermission.objects.create(project=project, user=user1, permission='read', display_name='User 1')
+        ProjectPermission.objects.create(project=project, user=user2, permission='add_users', display_name='User 2')
 
         client.login(username='testuser', password='testpassword')
 
@@ -229,4 +561,73 @@ class ViewsTest(TestCase):
         self.assertFalse(project.users.filter(id=user1.id).exists())
         self.assertFalse(project.users.filter(id=user2.id).exists())
 
-    
\ No newline at end of file
+class AgendaViewTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpassword')
+        self.owner = User.objects.create_user(username='owner', password='ownerpassword')
+        self.client = Client()
+        self.client.login(username='testuser', password='testpassword')
+
+    def project_with_task(self, name, end, status='Not yet started', member=True, assigned=True):
+        project = Project.objects.create(name=name, creator=self.owner)
+        if member:
+            project.addUser(self.user)
+        task = Task.objects.create(project=project, name=f'{name} task', description='Task', start_datetime='2023-07-01 10:00Z',
+                                   end_datetime=end, status=status)
+        if assigned:
+            task.users.add(self.user)
+        return project, task
+
+    def agenda_names(self, response):
+        return [deadline.task.name for deadline in response.context['agenda']]
+
+    def test_agenda_lists_assigned_tasks_by_deadline(self):
+        self.project_with_task('Later', '2023-07-30 10:00Z')
+        self.project_with_task('Sooner', '2023-07-20 10:00Z')
+        self.project_with_task('Unassigned', '2023-07-10 10:00Z', assigned=False)
+        self.project_with_task('Done', '2023-07-10 10:00Z', status='Completed')
+        left, _ = self.project_with_task('Left', '2023-07-10 10:00Z')
+        left.removeUser(self.user)
+        deleted, _ = self.project_with_task('Deleted', '2023-07-10 10:00Z')
+        with mock.patch('core.background.submit'):
+            deleted.delete_project()
+
+        response = self.client.get(reverse('core:home'))
+        self.assertEqual(self.agenda_names(response), ['Sooner task', 'Later task'])
+
+        response = self.client.get(reverse('core:home'), {'completed': '1'})
+        self.assertEqual(self.agenda_names(response), ['Done task', 'Sooner task', 'Later task'])
+
+    def test_agenda_pagination(self):
+        for day in range(10, 15):
+            self.project_with_task(f'Project {day}', f'2023-07-{day} 10:00Z')
+
+        names = []
+        cursor = None
+        with mock.patch('core.views.AGENDA_PAGE_SIZE', 2):
+            while True:
+                response = self.client.get(reverse('core:home'), {'cursor': cursor} if cursor else {})
+                names += self.agenda_names(response)
+                cursor = response.context['agenda'].next_cursor
+                if not cursor:
+                    break
+        self.assertEqual(names, [f'Project {day} task' for day in range(10, 15)])
+
+    def test_agenda_query_is_one_index_range(self):
+        sql, params = TaskDeadline.objects.agenda(self.user).exclude(status='Completed').order_by('end_datetime', 'pk')[:51].query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertIn('USING INDEX core_taskdeadline_user_end_idx (user_id=?)', plan[0])
+        self.assertFalse(any(step.startswith('SCAN') or 'TEMP B-TREE' in step for step in plan))
+
+    def test_agenda_is_one_query(self):
+        for day in range(10, 13):
+            self.project_with_task(f'Project {day}', f'2023-07-{day} 10:00Z')
+        self.client.get(reverse('core:home'))  # Loads the session and user once
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('core:home'))
+        agenda_queries = [query for query in queries.captured_queries if 'core_task' in query['sql']]
+        self.assertEqual(len(agenda_queries), 1)
+        self.assertIn('FROM "core_taskdeadline"', agenda_queries[0]['sql'])
+        self.assertNotIn('core_task_users', agenda_queries[0]['sql'])
@@ -0,0 +1,96 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.db import transaction
+
+from . import background, imaging
+
+logger = logging.getLogger(__name__)
+
+# Thumbnails are rendered by a small process pool, so image decoding never competes with requests for the GIL.
+# At most THUMBNAIL_QUEUE_SIZE renders wait or run at once; uploads beyond that are not held up but left
+# without a thumbnail until build_thumbnails is run.
+THUMBNAIL_WORKERS = 2
+THUMBNAIL_QUEUE_SIZE = 100
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(THUMBNAIL_QUEUE_SIZE)
+
+
+def thumbnail_name(name):
+    # Stored next to the original, and shared by every File row pointing at the same blob
+    return f"{os.path.splitext(name)[0]}.thumb.jpg"
+
+
+def wants_thumbnail(name):
+    return imaging.is_available() and imaging.is_image_name(name)
+
+
+def schedule(file_obj):
+    """Queues a thumbnail for file_obj once the current transaction commits."""
+    if not wants_thumbnail(file_obj.file.name):
+        return
+    name = file_obj.file.name
+    storage = file_obj.file.storage
+    transaction.on_commit(lambda: _submit(storage, name))
+
+
+def build(storage, name):
+    """Renders the thumbnail of a blob in this process and records it. Returns whether one exists afterwards."""
+    target = thumbnail_name(name)
+    if not storage.exists(target) and not imaging.render_thumbnail(storage.path(name), storage.path(target)):
+        return False
+    _record(name, target)
+    return True
+
+
+def _submit(storage, name):
+    target = thumbnail_name(name)
+    if storage.exists(target):
+        # Another upload of the same content already has one
+        background.submit(_record, name, target)
+        return
+    if not _slots.acquire(blocking=False):
+        logger.warning("Thumbnail queue is full, skipping %s", name)
+        return
+    try:
+        future = _get_executor().submit(imaging.render_thumbnail, storage.path(name), storage.path(target))
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda future: _rendered(future, name, target))
+
+
+def _rendered(future, name, target):
+    _slots.release()
+    try:
+        rendered = future.result()
+    except Exception:
+        logger.exception("Rendering the thumbnail of %s failed", name)
+        return
+    if rendered:
+        # Database work happens on the background thread rather than the pool's result thread
+        background.submit(_record, name, target)
+
+
+def _record(name, target):
+    from .models import Project, File
+
+    rows = File.objects.filter(file=name, thumbnail='')
+    project_ids = set(rows.values_list('project_id', flat=True))
+    if rows.update(thumbnail=target):
+        for project_id in project_ids - {None}:
+            Project.mark_changed(project_id)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned rather than forked, a forked copy of a threaded server process is not safe to use
+            _executor = ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
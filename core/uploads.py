@@ -0,0 +1,68 @@
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler, StopUpload
+from django.template.defaultfilters import filesizeformat
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class QuotaUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams every upload of a request to a temporary file, hashing it on the way.
+
+    Parsing stops at the first chunk that takes a file past max_file_size or the request past
+    remaining_bytes, so an oversized upload never reaches disk in full. The reason is left on
+    request.upload_error. The hash is attached to the file as sha256, so storage need not read it again.
+    """
+
+    def __init__(self, request=None, max_file_size=None, remaining_bytes=None):
+        super().__init__(request)
+        self.max_file_size = max_file_size
+        self.remaining_bytes = remaining_bytes
+        self.received = 0
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file_size = 0
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file_size += len(raw_data)
+        self.received += len(raw_data)
+        if self.max_file_size is not None and self.file_size > self.max_file_size:
+            self._abort(f"{self.file_name} is larger than {filesizeformat(self.max_file_size)}.")
+        if self.remaining_bytes is not None and self.received > self.remaining_bytes:
+            self._abort(f"These files do not fit in the project's remaining {filesizeformat(max(self.remaining_bytes, 0))} of storage.")
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.digest.hexdigest()
+        return file
+
+    def _abort(self, message):
+        if self.request is not None:
+            self.request.upload_error = message
+        # Closing a temporary upload deletes it
+        self.file.close()
+        # The rest of the body is read and discarded, so the browser still gets the error page
+        raise StopUpload(connection_reset=False)
+
+
+def install_upload_handlers(request, project):
+    """
+    Replaces the request's upload handlers with quota-checking ones for project.
+
+    Must run before request.POST or request.FILES is read, so views using it are csrf_exempt
+    and apply csrf_protect themselves once the handlers are in place.
+    """
+    request.upload_error = None
+    request.upload_handlers = [QuotaUploadHandler(
+        request,
+        max_file_size=settings.FILE_UPLOAD_MAX_SIZE,
+        remaining_bytes=project.remaining_bytes(),
+    )]
@@ -10,14 +10,19 @@ urlpatterns = [
     path('myprojects/addproject', views.addproject, name='addproject'), # Add a project
     path('myprojects/<int:project_id>/', views.project, name='project'), # Overview of a project
     path('myprojects/<int:project_id>/deleteproject', views.deleteproject, name='deleteproject'), # Delete a project
+    path('myprojects/<int:project_id>/files/<int:file_id>/', views.downloadfile, name='downloadfile'), # Download an attachment
+    path('myprojects/<int:project_id>/files.zip', views.downloadprojectfiles, name='downloadprojectfiles'), # All attachments of a project as a ZIP
+    path('myprojects/<int:project_id>/search/', views.searchtasks, name='searchtasks'), # Full-text search over a project's tasks
     path('myprojects/<int:project_id>/usermanagement/', views.user_management, name='user_management'), # Bulk modify users' permissions
     path('myprojects/<int:project_id>/projectmanagement/', views.project_management, name='project_management'), # Manage a project
     path('myprojects/<int:project_id>/updateprojectname/', views.update_project_name, name='updateprojectname'),
+    path('myprojects/<int:project_id>/rotateinvitecode/', views.rotate_invite_code, name='rotateinvitecode'), # Replace the invite code
     path('myprojects/<int:project_id>/edituserprofile/', views.edit_user_profile, name='edituserprofile'),
     path('myprojects/<int:project_id>/allusers/', views.allusers, name='allusers'),
     path('myprojects/<str:invite_code>/join', views.joinproject, name='joinproject'), # Join a project
     path('myprojects/<int:project_id>/addtask', views.addtask, name='addtask'), # Add a task
     path('myprojects/<int:project_id>/<int:task_id>/', views.taskproperties, name='taskproperties'), # Overview of a task
+    path('myprojects/<int:project_id>/<int:task_id>/files.zip', views.downloadtaskfiles, name='downloadtaskfiles'), # All attachments of a task as a ZIP
     path('myprojects/<int:project_id>/<int:task_id>/deletetask', views.deletetask, name='deletetask'), # Delete a task
     path('myprojects/<int:project_id>/<int:task_id>/changetaskstatus', views.changetaskstatus, name='changetaskstatus'), # Change a task's status
     path('myprojects/<int:project_id>/<int:task_id>/modifytask', views.modifytask, name='modifytask') # Change a task's status
@@ -1,20 +1,61 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
 from django.contrib import messages
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import transaction
+from django.db.models import Q
 from django.http import HttpResponseRedirect
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+import hashlib
 import os
 
-from .models import Project, Task, ProjectPermission, UserProfile, File
-from .forms import AddTaskForm, AddProjectForm, ChangeTaskStatusForm, BulkModifyPermissionForm, BulkRemoveUserForm, ModifyTaskForm, UserProfileForm
+from .models import Project, Task, TaskDeadline, ProjectPermission, UserProfile, File
+from .permissions import get_permission_resolver
+from .pagination import KeysetPage
+from . import search
+from . import downloads
+from .uploads import install_upload_handlers, QuotaExceeded
+from .forms import TaskFilterForm, AddTaskForm, AddProjectForm, ChangeTaskStatusForm, BulkModifyPermissionForm, BulkRemoveUserForm, ModifyTaskForm, UserProfileForm, RotateInviteCodeForm
+
+TASK_PAGE_SIZE = 50
+MEMBER_PAGE_SIZE = 100
+AGENDA_PAGE_SIZE = 50
+TASK_SORT_FIELDS = ('start_datetime', 'end_datetime', 'status')
+
+def _project_etag(request, project_id, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    marker = Project.objects.filter(pk=project_id).values_list('version', 'updated_at').first()
+    if marker is None:
+        return None
+    version, updated_at = marker
+    # Pages show per-user content (permissions, greeting), so the user is part of the tag
+    key = f"{project_id}:{version}:{updated_at.isoformat()}:{request.user.id}:{request.user.first_name}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+# Project pages are revalidated on every load and answered with 304 Not Modified when nothing changed.
+# There is no Last-Modified: it has one-second resolution and cannot tell users apart, so only the ETag is used
+project_conditional_get = condition(etag_func=_project_etag)
 
 # Create your views here.
 def index(request):
     if not request.user.is_authenticated:
         return redirect(reverse("main:home"))
 
-    return render(request, "core/index.html")
+    # The user's agenda: tasks assigned to them in every project they belong to, soonest deadline first
+    show_completed = request.GET.get("completed") == "1"
+    deadlines = TaskDeadline.objects.agenda(request.user)
+    if not show_completed:
+        deadlines = deadlines.exclude(status="Completed")
+    agenda = KeysetPage(deadlines, "end_datetime", cursor=request.GET.get("cursor"), page_size=AGENDA_PAGE_SIZE)
+
+    return render(request, "core/index.html", {
+        "agenda": agenda,
+        "show_completed": show_completed,
+    })
 
 def myprojects(request):
     if not request.user.is_authenticated:
@@ -28,18 +69,104 @@ def myprojects(request):
         "joined_projects": joined_projects
     })
 
+@cache_control(private=True, no_cache=True)
+@project_conditional_get
 def project(request, project_id):
     if not request.user.is_authenticated:
         return redirect(reverse("main:home"))
 
-    project = Project.objects.get(id=project_id)
-    tasks = project.tasks.all()
+    project = get_object_or_404(Project, id=project_id)
+
+    # Sorting happens in the database; a leading '-' sorts in descending order
+    sort = request.GET.get("sort", "start_datetime")
+    if sort.removeprefix("-") not in TASK_SORT_FIELDS:
+        sort = "start_datetime"
+
+    tasks = project.tasks.for_table()
+    filter_form = TaskFilterForm(request.GET, project=project)
+    if filter_form.is_valid():
+        tasks = filter_form.filter_tasks(tasks)
+        # Sort and pagination links keep the active filters
+        filter_query = filter_form.filter_query()
+    else:
+        # The form shows what is wrong; listing every task instead would look like the filter applied
+        tasks = tasks.none()
+        filter_query = ""
+
+    tasks = KeysetPage(tasks, sort, cursor=request.GET.get("cursor"), page_size=TASK_PAGE_SIZE)
 
+    # The cached table is keyed by these validated values, so unknown parameters cannot add cache entries
     return render(request, "core/project.html", {
         "project": project,
         "tasks": tasks,
+        "sort": sort,
+        "cursor": tasks.current_cursor,
+        "filter_form": filter_form,
+        "filter_valid": filter_form.is_valid(),
+        "filter_query": filter_query,
+    })
+
+def searchtasks(request, project_id):
+    if not request.user.is_authenticated:
+        return redirect(reverse("main:home"))
+
+    project = get_object_or_404(Project, id=project_id)
+    if not get_permission_resolver(request, project.id).has_permission('read'):
+        return redirect(reverse("core:myprojects"))
+
+    query = request.GET.get("q", "").strip()
+    results = search.search_tasks(project.id, query) if query else []
+
+    return render(request, "core/searchtasks.html", {
+        "project": project,
+        "query": query,
+        "results": results,
     })
 
+def downloadfile(request, project_id, file_id):
+    if not request.user.is_authenticated:
+        return redirect(reverse("account_login"))
+
+    project = get_object_or_404(Project, id=project_id)
+    if not get_permission_resolver(request, project.id).has_permission('read'):
+        return redirect(reverse("core:myprojects"))
+
+    # Older attachments may only be linked to the project through their task
+    file_obj = get_object_or_404(
+        File.objects.filter(Q(project=project) | Q(task__project=project)).only('id', 'file', 'original_name', 'thumbnail'),
+        id=file_id
+    )
+    return downloads.file_response(request, file_obj, thumbnail=request.GET.get('variant') == 'thumbnail')
+
+def downloadprojectfiles(request, project_id):
+    if not request.user.is_authenticated:
+        return redirect(reverse("account_login"))
+
+    project = get_object_or_404(Project, id=project_id)
+    if not get_permission_resolver(request, project.id).has_permission('read'):
+        return redirect(reverse("core:myprojects"))
+
+    # Rows are read in chunks while the archive streams, one folder per task
+    files = File.objects.filter(
+        Q(project=project) | Q(task__project=project)
+    ).order_by('task_id', 'id').values_list('file', 'original_name', 'task_id', 'task__name').iterator(chunk_size=500)
+    entries = downloads.zip_entries(files, File._meta.get_field('file').storage, folder_by_task=True)
+    return downloads.zip_response(entries, f"{project.name}.zip")
+
+def downloadtaskfiles(request, project_id, task_id):
+    if not request.user.is_authenticated:
+        return redirect(reverse("account_login"))
+
+    project = get_object_or_404(Project, id=project_id)
+    if not get_permission_resolver(request, project.id).has_permission('read'):
+        return redirect(reverse("core:myprojects"))
+
+    task = get_object_or_404(Task, id=task_id, project=project)
+
+    files = task.task_files.order_by('id').values_list('file', 'original_name', 'task_id', 'task__name').iterator(chunk_size=500)
+    entries = downloads.zip_entries(files, File._meta.get_field('file').storage)
+    return downloads.zip_response(entries, f"{task.name}.zip")
+
 def addproject(request):
     if not request.user.is_authenticated:
         return redirect(reverse("main:home"))
@@ -78,7 +205,7 @@ def joinproject(request, invite_code):
     if not request.user.is_authenticated:
         return redirect(reverse("account_login"))
     
-    project = get_object_or_404(Project, invite_code=invite_code)
+    project = get_object_or_404(Project.by_invite_code(invite_code))
     user = request.user
     project.addUser(user)
     return redirect('core:project', project_id=project.id)
@@ -87,7 +214,7 @@ def edit_user_profile(request, project_id):
     if not request.user.is_authenticated:
         return redirect(reverse("account_login"))
     
-    project = Project.objects.get(id=project_id)
+    project = get_object_or_404(Project, id=project_id)
     user_profile = get_object_or_404(UserProfile, user=request.user, project_id=project_id)
 
     if request.method == 'POST':
@@ -106,58 +233,69 @@ def edit_user_profile(request, project_id):
 
     return render(request, 'core/edit_user_profile.html', context)
 
+@cache_control(private=True, no_cache=True)
+@project_conditional_get
 def allusers(request, project_id):
     if not request.user.is_authenticated:
         return redirect(reverse("main:home"))
 
-    project = Project.objects.get(id=project_id)
-    users = project.users.all()
+    project = get_object_or_404(Project, id=project_id)
+    users = KeysetPage(project.member_directory(), "member_id", cursor=request.GET.get("cursor"), page_size=MEMBER_PAGE_SIZE)
 
     return render(request, "core/allusers.html", {
         "project": project,
         "users": users,
     })
 
+@csrf_exempt
 def addtask(request, project_id):
     if not request.user.is_authenticated:
         return redirect(reverse("main:home"))
 
-    project = Project.objects.get(id=project_id)
+    project = get_object_or_404(Project, id=project_id)
     if request.method == "POST":
-        form = AddTaskForm(project_id, request.POST, request.FILES)  # Include request.FILES for file uploads
-        if form.is_valid():
-            task = form.save(commit=False)
-            task.project = project
-            task.save()
-
-            # Associate selected users with the task
-            selected_users = form.cleaned_data['users']
-            task.users.set(selected_users)
-
-            # Handle multiple files
-            new_files = request.FILES.getlist('new_files')
-            for uploaded_file in new_files:
-                file_instance = File(file=uploaded_file, project=project, task=task)
-                file_instance.save()
+        # Uploads are checked against the quotas while they arrive, so the handlers go in before the body is read
+        install_upload_handlers(request, project)
+    return _addtask(request, project)
 
-            # Save the task with associated users and files
-            form.save_m2m()
-
-            return redirect(reverse("core:project", args=(project.id,)))
+@csrf_protect
+def _addtask(request, project):
+    if request.method == "POST":
+        form = AddTaskForm(project.id, request.POST, request.FILES)  # Include request.FILES for file uploads
+        if form.is_valid() and not request.upload_error:
+            try:
+                with transaction.atomic():
+                    task = form.save(commit=False)
+                    task.project = project
+                    task.save()
+
+                    # Associate selected users with the task
+                    form.save_m2m()
+
+                    task.add_files(form.cleaned_data['new_files'] or [])
+            except QuotaExceeded as error:
+                form.add_error('new_files', str(error))
+            else:
+                return redirect(reverse("core:project", args=(project.id,)))
+
+        if request.upload_error:
+            form.add_error('new_files', request.upload_error)
 
     else:
-        form = AddTaskForm(project_id)
+        form = AddTaskForm(project.id)
 
     return render(request, "core/addtask.html", {
         "form": form,
         "project": project
     })
 
+@cache_control(private=True, no_cache=True)
+@project_conditional_get
 def taskproperties(request, project_id, task_id):
     if not request.user.is_authenticated:
         return redirect(reverse("main:home"))
 
-    project = Project.objects.get(id=project_id)
+    project = get_object_or_404(Project, id=project_id)
     task = Task.objects.get(id=task_id)
     return render(request, "core/taskproperties.html", {
         "project": project,
@@ -165,7 +303,7 @@ def taskproperties(request, project_id, task_id):
     })
 
 def changetaskstatus(request, project_id, task_id):
-    project = Project.objects.get(id=project_id)
+    project = get_object_or_404(Project, id=project_id)
     task = Task.objects.get(id=task_id)
     if request.method == "POST":
         form = ChangeTaskStatusForm(request.POST, instance=task)
@@ -181,31 +319,34 @@ def changetaskstatus(request, project_id, task_id):
         "task": task
     })
 
+@csrf_exempt
 def modifytask(request, project_id, task_id):
     task = get_object_or_404(Task, id=task_id, project_id=project_id)
     project = task.project
 
     if request.method == "POST":
-        form = ModifyTaskForm(request.POST, request.FILES, instance=task, project=project)
-        if form.is_valid():
-            task = form.save()
-            
-            files_to_delete = form.cleaned_data['files_to_delete']
-
-            if files_to_delete:
-                # return render(request, 'core/confirm_file_deletion.html', {
-                #     'files_to_delete': files_to_delete,
-                #     'project': project
-                # })
-                for file in files_to_delete:
-                    file.delete()
-                return redirect(reverse("core:project", args=(project_id,)))
-
-            files = request.FILES.getlist('new_files')
-            for file in files:
-                File.objects.create(task=task, file=file)
+        install_upload_handlers(request, project)
+    return _modifytask(request, project, task)
 
-            return redirect(reverse("core:project", args=(project_id,)))
+@csrf_protect
+def _modifytask(request, project, task):
+    if request.method == "POST":
+        form = ModifyTaskForm(request.POST, request.FILES, instance=task, project=project)
+        if form.is_valid() and not request.upload_error:
+            try:
+                # The edits, deletions and new files are saved together or not at all
+                with transaction.atomic():
+                    task = form.save()
+                    # Added before the old files are deleted, so a failed add only releases blobs no kept row points to
+                    task.add_files(form.cleaned_data['new_files'] or [])
+                    form.cleaned_data['files_to_delete'].delete_files()
+            except QuotaExceeded as error:
+                form.add_error('new_files', str(error))
+            else:
+                return redirect(reverse("core:project", args=(project.id,)))
+
+        if request.upload_error:
+            form.add_error('new_files', request.upload_error)
     else:
         form = ModifyTaskForm(instance=task, project=project)
 
@@ -236,8 +377,8 @@ def user_management(request, project_id):
         return redirect(reverse("main:home"))
 
     project = get_object_or_404(Project, id=project_id)
-    project_permission = ProjectPermission.objects.filter(project=project, user=request.user).first()
-    users = project.users.all()
+    # Each member's permission label and level come with their row, so the table is one query
+    users = project.member_directory().order_by("member_id")
 
     if request.method == "POST":
         form_modify_permissions = BulkModifyPermissionForm(request.POST, project=project, request=request)
@@ -247,9 +388,7 @@ def user_management(request, project_id):
             new_permission = form_modify_permissions.cleaned_data['new_permission']
             selected_users = form_modify_permissions.cleaned_data['selected_users']
 
-            for user_id in selected_users:
-                user = User.objects.get(id=user_id)
-                project.updatePermission(user, new_permission)
+            project.update_permissions(selected_users, new_permission)
 
             messages.success(request, "Permissions updated successfully.")
             return redirect('core:project', project_id=project.id)
@@ -257,9 +396,7 @@ def user_management(request, project_id):
         if form_delete_users.is_valid():
             selected_users = form_delete_users.cleaned_data['selected_users']
 
-            for user_id in selected_users:
-                user = User.objects.get(id=user_id)
-                project.removeUser(user)
+            project.remove_users(selected_users)
 
             messages.success(request, "Users removed successfully.")
             return redirect('core:project', project_id=project.id)
@@ -280,13 +417,32 @@ def project_management(request, project_id):
     
     project = get_object_or_404(Project, id=project_id)
 
-    if not ProjectPermission.objects.filter(project=project, user=request.user).first().has_permission('delete_project'):
+    if not get_permission_resolver(request, project.id).has_permission('delete_project'):
         return redirect(reverse("core:project", args=(project.id,)))
                         
     return render(request, "core/projectmanagement.html", {
         "project": project,
+        "invite_code_form": RotateInviteCodeForm(),
+        "storage_quota": settings.PROJECT_STORAGE_QUOTA,
     })
 
+def rotate_invite_code(request, project_id):
+    if not request.user.is_authenticated:
+        return redirect(reverse("main:home"))
+
+    project = get_object_or_404(Project, id=project_id)
+
+    if not get_permission_resolver(request, project.id).has_permission('delete_project'):
+        return redirect(reverse("core:project", args=(project.id,)))
+
+    if request.method == "POST":
+        form = RotateInviteCodeForm(request.POST)
+        if form.is_valid():
+            project.rotate_invite_code(expires_at=form.expires_at())
+            messages.success(request, "The invite code has been replaced, previous invite links no longer work.")
+
+    return redirect(reverse("core:project_management", args=(project.id,)))
+
 def update_project_name(request, project_id):
     if not request.user.is_authenticated:
         return redirect(reverse("main:home"))
@@ -296,6 +452,6 @@ def update_project_name(request, project_id):
     if request.method == "POST":
         new_name = request.POST.get("project_name")
         project.name = new_name
-        project.save()
+        project.save(update_fields=['name'])
 
     return redirect(reverse("core:project_management", args=(project.id,)))
\ No newline at end of file